@@ -1,118 +1,468 @@
 import os
+import numpy as np
 import pdf2image
 import streamlit as st
 from PIL import Image
 import time
+import shutil
 import subprocess
-import sys
 import hashlib
+import uuid
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait
 from config import OUTPUT_DIR, POPPLER_PATH, LIBREOFFICE_PATH, INTERMEDIATE_DIR
+from optimized_display import get_preview_path, integrate_optimized_display
+
+try:
+    import pyvips  # 可选依赖：安装 libvips 后使用流式拼接，无需在内存中构建整张长图
+except (ImportError, OSError):
+    pyvips = None
+
+try:
+    # 可选依赖：libjpeg-turbo 的 SIMD 编码器，直接编码 NumPy 缓冲区
+    from turbojpeg import TurboJPEG, TJPF_RGB, TJSAMP_420, TJFLAG_PROGRESSIVE
+    turbo_jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    turbo_jpeg = None
+
+try:
+    import blake3  # 可选依赖：SIMD 实现的 BLAKE3，计算文件哈希更快
+except ImportError:
+    blake3 = None
 
 # 增加 PIL 的最大图像像素限制，防止 DecompressionBombWarning
 Image.MAX_IMAGE_PIXELS = 500000000  # 5亿像素
 
+# 原始像素数据超过该大小时不再启用 PNG optimize（多轮滤波尝试，对超大图极慢），
+# 改用较低的压缩级别并跳过逐行滤波选择，以少量体积换取数倍的写出速度
+PNG_OPTIMIZE_MAX_BYTES = 100 * 1024 * 1024
+PNG_FAST_COMPRESS_LEVEL = 3
+
+# 写入上传文件和计算哈希时每次处理的数据块大小
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# PDF 每批光栅化的页数，峰值内存只与批大小相关
+PDF_CHUNK_SIZE = 8
+
+# 光栅化并行进程数，预留一个核心给 Streamlit 主线程
+RASTERIZE_THREADS = max(1, (os.cpu_count() or 1) - 1)
+
+# 并行解码并粘贴页面的线程数，各页写入画布中互不重叠的行区间
+MERGE_THREADS = os.cpu_count() or 1
+
+# 中间页面以高质量 JPEG 保存，减小落盘和合并时的读取量
+PAGE_JPEG_QUALITY = 95
+
+# 页面缓存目录中的完成标记，存在时表示该目录下的页面完整可用
+PAGE_CACHE_MARKER = "done.marker"
+
+# 光栅化页面的磁盘缓存，超过容量时按最近使用时间淘汰
+PAGE_CACHE_DIR = os.path.join(INTERMEDIATE_DIR, "pages")
+PAGE_CACHE_MAX_BYTES = 5 * 1024 * 1024 * 1024
+
+# 常驻 LibreOffice 服务的 UNO 连接串，配合 unoconv 复用已启动的进程
+SOFFICE_ACCEPT = "socket,host=localhost,port=2002;urp;"
+UNOCONV_PATH = shutil.which("unoconv")
+
+# 进度刷新的最小间隔（秒），避免逐页向前端发送消息
+PROGRESS_UPDATE_INTERVAL = 0.1
+
+# 预览图的最大尺寸，高度受 JPEG 单边 65535 像素的限制
+PREVIEW_MAX_WIDTH = 2000
+PREVIEW_MAX_HEIGHT = 65500
+PREVIEW_JPEG_QUALITY = 85
+
+# 转换结果的磁盘缓存，服务重启后仍可复用；超过容量时按最近使用时间淘汰
+RESULT_CACHE_DIR = os.path.join(OUTPUT_DIR, "cache")
+RESULT_CACHE_MAX_BYTES = 10 * 1024 * 1024 * 1024
+RESULT_CACHE_INDEX = "result.txt"
+
 st.set_page_config(page_title="文件转长图工具", page_icon="🖼️")
 
-def get_file_hash(file_content):
-    """计算文件内容的哈希值，用于识别文件是否已处理"""
-    return hashlib.md5(file_content).hexdigest()
+def save_uploaded_file(uploaded_file, dest_path):
+    """将上传文件分块写入磁盘，同时计算哈希值用于识别文件是否已处理"""
+    hasher = blake3.blake3() if blake3 is not None else hashlib.blake2b(digest_size=16)
+    uploaded_file.seek(0)
+    with open(dest_path, "wb") as f:
+        for chunk in iter(lambda: uploaded_file.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+            f.write(chunk)
+    return hasher.hexdigest()[:32]
 
-def merge_images(images, output_path, output_format="PNG", quality=85):
-    """合并图像并返回实际保存的文件路径"""
-    st.write("开始合并图像...")
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    start_time = time.time()
+def get_page_cache_dir(file_hash, dpi):
+    """页面缓存目录，按文件哈希和 DPI 区分"""
+    return os.path.join(PAGE_CACHE_DIR, f"{file_hash[:16]}_{dpi}")
+
+def load_cached_pages(page_cache_dir):
+    """读取已完成的页面缓存，命中时刷新目录时间用于 LRU 淘汰；缓存不存在或不完整时返回 None"""
+    if not os.path.exists(os.path.join(page_cache_dir, PAGE_CACHE_MARKER)):
+        return None
+    os.utime(page_cache_dir)
+    return sorted(os.path.join(page_cache_dir, name)
+                  for name in os.listdir(page_cache_dir) if name.startswith("page_"))
+
+@st.cache_resource
+def start_office_listener():
+    """启动常驻的无界面 LibreOffice 服务，避免每次转换都重新初始化"""
+    return subprocess.Popen(
+        [LIBREOFFICE_PATH, "--headless", "--invisible", "--norestore", "--nologo",
+         f"--accept={SOFFICE_ACCEPT}"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def convert_office_to_pdf(file_path, output_dir):
+    """将 Office 等文档转换为 PDF，返回 PDF 路径"""
+    base_name = os.path.splitext(os.path.basename(file_path))[0]
+    pdf_path = os.path.join(output_dir, f"{base_name}.pdf")
+
+    if UNOCONV_PATH is not None:
+        listener = start_office_listener()
+        if listener.poll() is not None:
+            # 服务进程已退出，重新启动
+            start_office_listener.clear()
+            listener = start_office_listener()
+        result = subprocess.run([UNOCONV_PATH, "-c", SOFFICE_ACCEPT, "-f", "pdf", "-o", pdf_path, file_path],
+                                capture_output=True)
+        if result.returncode == 0 and os.path.exists(pdf_path):
+            return pdf_path
+
+    # 未安装 unoconv 或转换失败时单独启动一次 LibreOffice，使用独立配置目录以免与常驻服务冲突
+    profile_dir = Path(INTERMEDIATE_DIR, "lo_profile").resolve()
+    subprocess.run([LIBREOFFICE_PATH, f"-env:UserInstallation={profile_dir.as_uri()}",
+                    "--headless", "--convert-to", "pdf", file_path, "--outdir", output_dir],
+                   capture_output=True)
+    return pdf_path
+
+def load_cached_result(result_cache_dir):
+    """读取磁盘缓存的转换结果，命中时刷新目录时间用于 LRU 淘汰"""
+    index_path = os.path.join(result_cache_dir, RESULT_CACHE_INDEX)
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, encoding="utf-8") as f:
+        output_path = os.path.join(result_cache_dir, f.read().strip())
+    if not os.path.exists(output_path):
+        return None
+    os.utime(result_cache_dir)
+    return output_path
+
+def evict_disk_cache(cache_dir, max_bytes, keep_dir):
+    """磁盘缓存超过容量上限时，从最久未使用的目录开始删除；结果缓存和页面缓存共用"""
+    entries = []
+    total_size = 0
+    with os.scandir(cache_dir) as it:
+        for entry in it:
+            # 跳过正在写入的临时目录
+            if not entry.is_dir() or entry.name.endswith(".tmp"):
+                continue
+            size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+            entries.append((entry.stat().st_mtime, size, entry.path))
+            total_size += size
+
+    for _, size, path in sorted(entries):
+        if total_size <= max_bytes:
+            break
+        if os.path.samefile(path, keep_dir):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total_size -= size
+
+def convert_to_result_cache(file_path, conversion_key, dpi, file_hash, output_format, quality):
+    """转换文件并写入磁盘结果缓存，返回缓存中的文件路径"""
+    result_cache_dir = os.path.join(RESULT_CACHE_DIR, conversion_key)
+    # 先写入临时目录，完成后整体重命名，其他会话不会读到写了一半的结果
+    staging_dir = f"{result_cache_dir}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(staging_dir)
+    try:
+        output_path = convert_to_image(file_path, staging_dir, dpi, file_hash, output_format, quality)
+        if output_path is None:
+            return None
+        with open(os.path.join(staging_dir, RESULT_CACHE_INDEX), "w", encoding="utf-8") as f:
+            f.write(os.path.basename(output_path))
+        try:
+            os.replace(staging_dir, result_cache_dir)
+        except OSError:
+            # 其他会话已写入相同的结果
+            return load_cached_result(result_cache_dir)
+        evict_disk_cache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES, result_cache_dir)
+        return os.path.join(result_cache_dir, os.path.basename(output_path))
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+def rasterize_pdf(pdf_path, dpi, output_folder, on_progress=None):
+    """分批将 PDF 光栅化为页面文件，返回按页序排列的文件路径列表"""
+    page_count = pdf2image.pdfinfo_from_path(pdf_path, poppler_path=POPPLER_PATH)["Pages"]
+    page_paths = []
+    for first_page in range(1, page_count + 1, PDF_CHUNK_SIZE):
+        last_page = min(first_page + PDF_CHUNK_SIZE - 1, page_count)
+        chunk_paths = pdf2image.convert_from_path(
+            pdf_path, poppler_path=POPPLER_PATH, dpi=dpi,
+            first_page=first_page, last_page=last_page,
+            output_folder=output_folder, paths_only=True,
+            fmt='jpeg', jpegopt={'quality': PAGE_JPEG_QUALITY},
+            thread_count=RASTERIZE_THREADS, use_pdftocairo=True)
+        # 重命名为按页码排序的固定文件名，便于从缓存中按序读取
+        for page_number, chunk_path in enumerate(chunk_paths, start=first_page):
+            page_path = os.path.join(output_folder, f"page_{page_number:05d}.jpg")
+            os.replace(chunk_path, page_path)
+            page_paths.append(page_path)
+        if on_progress:
+            on_progress(last_page, page_count)
+    return page_paths
+
+def merge_images_with_vips(page_paths, output_path, output_format, quality, progress_bar, status_text):
+    """使用 libvips 拼接并写出图像，像素按条带流式处理，峰值内存与页数无关"""
+    tiles = []
+    total_images = len(page_paths)
+    last_update = 0.0
+    for idx, page_path in enumerate(page_paths):
+        tile = pyvips.Image.new_from_file(page_path, access='sequential')
+        if tile.bands != 3:
+            tile = tile.colourspace('srgb')[:3]
+        tiles.append(tile)
+        now = time.monotonic()
+        if now - last_update > PROGRESS_UPDATE_INTERVAL or idx + 1 == total_images:
+            progress_bar.progress((idx + 1) / total_images * 0.5)
+            last_update = now
+
+    if len({tile.height for tile in tiles}) == 1:
+        joined = pyvips.Image.arrayjoin(tiles, across=1)
+    else:
+        # arrayjoin 按最大页高划分网格，页高不一致时逐页纵向拼接
+        joined = tiles[0]
+        for tile in tiles[1:]:
+            joined = joined.join(tile, 'vertical', expand=True)
+
+    if joined.width * joined.height * joined.bands <= PNG_OPTIMIZE_MAX_BYTES:
+        png_options = {"compression": 6}
+    else:
+        png_options = {"compression": PNG_FAST_COMPRESS_LEVEL, "filter": pyvips.enums.ForeignPngFilter.NONE}
+
+    status_text.text("正在写出图像...")
+    if output_format == "JPG":
+        try:
+            joined.jpegsave(output_path, Q=quality, optimize_coding=True, interlace=True, strip=True)
+        except pyvips.Error:
+            # JPEG 单边最大 65535 像素，超出时改为保存为 PNG
+            st.warning("JPEG 保存失败，改为保存为 PNG 格式")
+            output_path = output_path.replace('.jpg', '.png')
+            joined.pngsave(output_path, strip=True, **png_options)
+    else:
+        joined.pngsave(output_path, strip=True, **png_options)
 
-    widths, heights = zip(*(i.size for i in images))
-    total_height = sum(heights)
-    max_width = max(widths)
+    # 从已写出的文件流式缩放生成预览图
+    status_text.text("正在生成预览图...")
+    preview = pyvips.Image.thumbnail(output_path, PREVIEW_MAX_WIDTH, height=PREVIEW_MAX_HEIGHT, size='down')
+    preview.jpegsave(get_preview_path(output_path), Q=PREVIEW_JPEG_QUALITY, strip=True)
 
-    merged_image = Image.new('RGB', (max_width, total_height))
-    y_offset = 0
+    status_text.text("图像合并并压缩完成！")
+    progress_bar.progress(1.0)
+    return output_path
 
-    total_images = len(images)
-    for idx, img in enumerate(images):
-        merged_image.paste(img, (0, y_offset))
-        y_offset += img.height
+def save_jpeg_with_turbo(canvas, output_path, quality):
+    """使用 libjpeg-turbo 将 RGB 缓冲区编码为渐进式 JPEG"""
+    jpeg_data = turbo_jpeg.encode(canvas, quality=quality, pixel_format=TJPF_RGB,
+                                  jpeg_subsample=TJSAMP_420, flags=TJFLAG_PROGRESSIVE)
+    with open(output_path, "wb") as f:
+        f.write(jpeg_data)
 
-        # 更新进度
-        progress = (idx + 1) / total_images
-        progress_bar.progress(progress)
-        elapsed_time = time.time() - start_time
-        estimated_total_time = elapsed_time / progress
-        remaining_time = estimated_total_time - elapsed_time
-        status_text.text(f"正在合并图像：{idx + 1}/{total_images}，预计剩余时间：{int(remaining_time)}秒")
+@st.cache_resource
+def get_image_writer():
+    """单线程写出队列，编码与写盘在后台执行"""
+    return ThreadPoolExecutor(max_workers=1)
 
+def save_merged_image(merged_image, canvas, output_path, output_format, quality, png_options):
+    """编码并保存合并后的图像，返回实际保存路径和需要提示的警告"""
+    warnings = []
     # 保存并压缩图像
     if output_format == "JPG":
-        merged_image = merged_image.convert("RGB")  # 确保是 RGB 模式
         try:
-            merged_image.save(output_path, format="JPEG", quality=quality)
+            if turbo_jpeg is not None:
+                save_jpeg_with_turbo(canvas, output_path, quality)
+            else:
+                # 最优 Huffman 表 + 渐进式编码，同等质量下文件更小
+                merged_image.save(output_path, format="JPEG", quality=quality,
+                                  optimize=True, progressive=True, subsampling=2)
         except (OSError, IOError) as e:
-            if "encoder error" in str(e).lower():
+            if turbo_jpeg is not None or "encoder error" in str(e).lower():
                 # 如果 JPEG 保存失败，尝试使用不同的参数或降级保存
-                st.warning("JPEG 编码出现问题，尝试其他保存方式...")
+                warnings.append("JPEG 编码出现问题，尝试其他保存方式...")
                 try:
                     # 尝试使用较低的质量设置和不同的子采样
                     merged_image.save(output_path, format="JPEG", quality=min(quality, 85), 
                                     optimize=False, progressive=False, subsampling=2)
                 except:
                     # 如果仍然失败，改为保存为 PNG
-                    st.warning("JPEG 保存失败，改为保存为 PNG 格式")
+                    warnings.append("JPEG 保存失败，改为保存为 PNG 格式")
                     output_path = output_path.replace('.jpg', '.png')
-                    merged_image.save(output_path, format="PNG", optimize=True)
+                    merged_image.save(output_path, format="PNG", **png_options)
             else:
                 raise
     else:
-        merged_image.save(output_path, format="PNG", optimize=True)
-        
+        merged_image.save(output_path, format="PNG", **png_options)
+    return output_path, warnings
+
+def merge_images(page_paths, output_path, output_format="PNG", quality=85):
+    """按顺序纵向合并页面图像文件并返回实际保存的文件路径"""
+    st.write("开始合并图像...")
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+    start_time = time.time()
+
+    if pyvips is not None:
+        return merge_images_with_vips(page_paths, output_path, output_format, quality, progress_bar, status_text)
+
+    # Image.open 只解析文件头，此处不会解码像素
+    def read_size(page_path):
+        with Image.open(page_path) as img:
+            return img.size
+    sizes = np.fromiter((v for page_path in page_paths for v in read_size(page_path)),
+                        dtype=np.int64, count=2 * len(page_paths)).reshape(-1, 2)
+    total_height = int(sizes[:, 1].sum())
+    max_width = int(sizes[:, 0].max())
+    # 每页在画布中的起始行
+    y_offsets = np.concatenate(([0], np.cumsum(sizes[:, 1])[:-1]))
+
+    # 合并时同步缩放出预览图，显示时无需再解码整张长图
+    preview_ratio = min(1.0, PREVIEW_MAX_WIDTH / max_width, PREVIEW_MAX_HEIGHT / total_height)
+    # 向下取整：各页四舍五入后的高度之和可能超过 PREVIEW_MAX_HEIGHT（JPEG 单边上限）
+    preview_sizes = np.maximum(1, np.floor(sizes * preview_ratio).astype(np.int64))
+    preview_offsets = np.concatenate(([0], np.cumsum(preview_sizes[:, 1])[:-1]))
+    preview = np.zeros((int(preview_sizes[:, 1].sum()), int(preview_sizes[:, 0].max()), 3), dtype=np.uint8)
+
+    # 直接在 NumPy 缓冲区中按行拼接，避免逐张 paste 的 Python 开销
+    # 画布映射到中间目录下的临时文件，由内核按需换出脏页，长图不再受物理内存限制
+    canvas_path = os.path.join(INTERMEDIATE_DIR, f"{uuid.uuid4().hex}.raw")
+    canvas = np.memmap(canvas_path, mode='w+', dtype=np.uint8, shape=(total_height, max_width, 3))
+    merged_image = None
+    future = None
+    try:
+        def paste_page(idx):
+            # 解码、缩放和切片赋值都会释放 GIL，可在多个线程中同时进行
+            with Image.open(page_paths[idx]) as img:
+                # 仅在非 RGB 页面（如 CMYK/RGBA）上转换，RGB 页面直接取用像素
+                if img.mode != 'RGB':
+                    img = img.convert('RGB')
+                arr = np.asarray(img)
+                preview_width, preview_height = (int(v) for v in preview_sizes[idx])
+                small = np.asarray(img.resize((preview_width, preview_height), Image.Resampling.BILINEAR))
+            y_offset = y_offsets[idx]
+            canvas[y_offset:y_offset + arr.shape[0], :arr.shape[1]] = arr
+            preview_offset = preview_offsets[idx]
+            preview[preview_offset:preview_offset + preview_height, :preview_width] = small
+
+        total_images = len(page_paths)
+        # 按时间间隔节流进度刷新，减少 Streamlit 的消息往返
+        last_update = 0.0
+        with ThreadPoolExecutor(max_workers=MERGE_THREADS) as executor:
+            # 进度在主线程中按完成顺序刷新，工作线程不调用 Streamlit
+            for idx, _ in enumerate(executor.map(paste_page, range(total_images))):
+                # 更新进度
+                now = time.monotonic()
+                if now - last_update > PROGRESS_UPDATE_INTERVAL or idx + 1 == total_images:
+                    last_update = now
+                    progress = (idx + 1) / total_images
+                    progress_bar.progress(progress)
+                    elapsed_time = time.time() - start_time
+                    estimated_total_time = elapsed_time / progress
+                    remaining_time = estimated_total_time - elapsed_time
+                    status_text.text(f"正在合并图像：{idx + 1}/{total_images}，预计剩余时间：{int(remaining_time)}秒")
+
+        canvas.flush()
+        merged_image = Image.frombuffer('RGB', (max_width, total_height), canvas, 'raw', 'RGB', 0, 1)
+        if canvas.nbytes <= PNG_OPTIMIZE_MAX_BYTES:
+            png_options = {"optimize": True}
+        else:
+            png_options = {"compress_level": PNG_FAST_COMPRESS_LEVEL}
+
+        # 编码与写盘交给后台线程，主线程继续刷新界面
+        future = get_image_writer().submit(save_merged_image, merged_image, canvas, output_path,
+                                           output_format, quality, png_options)
+        # 预览图较小，在主线程保存，与后台编码同时进行
+        Image.fromarray(preview).save(get_preview_path(output_path), format="JPEG", quality=PREVIEW_JPEG_QUALITY)
+        while not future.done():
+            status_text.text(f"正在编码并写入图像... 已用时 {int(time.time() - start_time)} 秒")
+            time.sleep(0.2)
+        output_path, warnings = future.result()
+        for warning in warnings:
+            st.warning(warning)
+    finally:
+        # 主线程提前退出（预览保存出错、重跑或停止）时后台线程可能仍在读取映射文件，
+        # 先等它结束，否则 Windows 上删除会因文件被占用而失败并掩盖原始错误
+        if future is not None:
+            wait([future])
+        # 先释放对映射文件的引用，再删除临时文件
+        del merged_image, canvas
+        os.remove(canvas_path)
+
     status_text.text("图像合并并压缩完成！")
     progress_bar.progress(1.0)
     return output_path  # 返回实际保存的文件路径
 
-def convert_to_image(file_path, output_dir, dpi, output_format="PNG", quality=85):
+def convert_to_image(file_path, output_dir, dpi, file_hash, output_format="PNG", quality=85):
     """转换文件为图像并返回实际保存的文件路径"""
     st.write("开始转换文件...")
     progress_bar = st.progress(0)
     status_text = st.empty()
     start_time = time.time()
 
-    images = []
     base_name = os.path.splitext(os.path.basename(file_path))[0]
+    # 页面按 (文件哈希, DPI) 缓存，仅修改输出格式或质量时无需重新光栅化
+    page_cache_dir = get_page_cache_dir(file_hash, dpi)
+    page_paths = load_cached_pages(page_cache_dir)
 
-    if file_path.lower().endswith('.pdf'):
-        images = pdf2image.convert_from_path(file_path, poppler_path=POPPLER_PATH, dpi=dpi)
-        progress_bar.progress(0.3)
-    elif file_path.lower().endswith((".doc", ".docx", ".ppt", ".pptx", ".csv", ".xls", ".xlsx", ".odt", ".rtf", ".txt", ".psd", ".cdr", ".wps", ".svg")):
-        if LIBREOFFICE_PATH is None:
-            raise ValueError("LibreOffice 未安装。请安装 LibreOffice 以支持非 PDF 文件的转换。\n"
-                           "macOS 安装方法：\n"
-                           "1. 从 https://www.libreoffice.org/download/download/ 下载\n"
-                           "2. 或使用 Homebrew: brew install --cask libreoffice")
-        
-        pdf_path = os.path.join(output_dir, f"{base_name}.pdf")
-        if sys.platform.startswith('win'):
-            conversion_cmd = f'"{LIBREOFFICE_PATH}" --headless --convert-to pdf "{file_path}" --outdir "{output_dir}"'
-        else:
-            conversion_cmd = f'{LIBREOFFICE_PATH} --headless --convert-to pdf "{file_path}" --outdir "{output_dir}"'
-        
-        subprocess.run(conversion_cmd, shell=True, capture_output=True)
-
-        if not os.path.exists(pdf_path):
-            raise ValueError("文件转换为 PDF 失败")
-        else:
-            status_text.text(f"文件转换为 PDF 成功，正在转换为图像: {pdf_path}")
-            progress_bar.progress(0.6)
+    def report_rasterize(start, span):
+        def on_progress(done, total):
+            progress_bar.progress(start + span * done / total)
+            status_text.text(f"正在转换页面：{done}/{total}")
+        return on_progress
 
-        images = pdf2image.convert_from_path(pdf_path, poppler_path=POPPLER_PATH, dpi=dpi)
+    if page_paths:
+        status_text.text("使用缓存的页面图像")
         progress_bar.progress(0.9)
     else:
-        raise ValueError("不支持的文件格式")
+        # 先光栅化到本会话独有的临时目录，完成后整体重命名；
+        # 同时转换同一文件的其他会话不会删掉或读到写了一半的页面
+        staging_dir = f"{page_cache_dir}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(staging_dir)
+        try:
+            if file_path.lower().endswith('.pdf'):
+                page_paths = rasterize_pdf(file_path, dpi, staging_dir, report_rasterize(0.0, 0.3))
+            elif file_path.lower().endswith((".doc", ".docx", ".ppt", ".pptx", ".csv", ".xls", ".xlsx", ".odt", ".rtf", ".txt", ".psd", ".cdr", ".wps", ".svg")):
+                if LIBREOFFICE_PATH is None:
+                    raise ValueError("LibreOffice 未安装。请安装 LibreOffice 以支持非 PDF 文件的转换。\n"
+                                   "macOS 安装方法：\n"
+                                   "1. 从 https://www.libreoffice.org/download/download/ 下载\n"
+                                   "2. 或使用 Homebrew: brew install --cask libreoffice")
+                
+                # 中间 PDF 直接写入页面临时目录，光栅化后立即删除，不再留在输出目录
+                pdf_path = convert_office_to_pdf(file_path, staging_dir)
+
+                if not os.path.exists(pdf_path):
+                    raise ValueError("文件转换为 PDF 失败")
+                else:
+                    status_text.text("文件转换为 PDF 成功，正在转换为图像")
+                    progress_bar.progress(0.6)
 
-    if images:
+                page_paths = rasterize_pdf(pdf_path, dpi, staging_dir, report_rasterize(0.6, 0.3))
+                os.remove(pdf_path)
+            else:
+                raise ValueError("不支持的文件格式")
+
+            # 全部页面写入成功后才标记缓存可用
+            with open(os.path.join(staging_dir, PAGE_CACHE_MARKER), "w"):
+                pass
+            try:
+                os.replace(staging_dir, page_cache_dir)
+            except OSError:
+                # 其他会话已写入相同的页面，改用已有的缓存
+                pass
+            page_paths = load_cached_pages(page_cache_dir)
+            evict_disk_cache(PAGE_CACHE_DIR, PAGE_CACHE_MAX_BYTES, page_cache_dir)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    if page_paths:
         merged_output_path = os.path.join(output_dir, f"{base_name}.{output_format.lower()}")
-        actual_output_path = merge_images(images, merged_output_path, output_format, quality)
+        actual_output_path = merge_images(page_paths, merged_output_path, output_format, quality)
         progress_bar.progress(1.0)
         status_text.text("文件转换完成！")
         return actual_output_path  # 返回实际保存的文件路径
@@ -125,6 +475,8 @@ if 'last_file_hash' not in st.session_state:
     st.session_state.last_file_hash = None
 if 'last_output_path' not in st.session_state:
     st.session_state.last_output_path = None
+if 'upload_hashes' not in st.session_state:
+    st.session_state.upload_hashes = {}  # 上传文件 ID -> 文件哈希，避免每次重跑都重新读取文件
 
 st.title("文件转长图工具")
 
@@ -136,43 +488,48 @@ uploaded_file = st.file_uploader("上传文件", type=["pdf", "doc", "docx", "pp
 
 if uploaded_file is not None:
     # 创建必要的目录
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    os.makedirs(RESULT_CACHE_DIR, exist_ok=True)
     os.makedirs(INTERMEDIATE_DIR, exist_ok=True)
+    os.makedirs(PAGE_CACHE_DIR, exist_ok=True)
     
-    # 获取文件内容和哈希
-    file_content = uploaded_file.getbuffer()
-    file_hash = get_file_hash(file_content)
-    
-    # 构建转换参数的唯一标识
-    conversion_key = f"{file_hash}_{dpi}_{output_format}_{quality}"
-    
-    # 检查是否已经处理过相同的文件和参数
-    if conversion_key in st.session_state.processed_files:
-        # 使用缓存的结果
-        actual_output_path = st.session_state.processed_files[conversion_key]
-        st.success("使用缓存的转换结果")
-    else:
-        # 保存上传的文件到临时目录
-        temp_file_path = os.path.join(INTERMEDIATE_DIR, uploaded_file.name)
-        with open(temp_file_path, "wb") as f:
-            f.write(file_content)
+    temp_file_path = os.path.join(INTERMEDIATE_DIR, uploaded_file.name)
+    try:
+        # 首次遇到该上传文件时边写入临时文件边计算哈希，只读取一遍
+        file_hash = st.session_state.upload_hashes.get(uploaded_file.file_id)
+        if file_hash is None:
+            file_hash = save_uploaded_file(uploaded_file, temp_file_path)
+            st.session_state.upload_hashes[uploaded_file.file_id] = file_hash
         
-        try:
-            # 执行转换
-            actual_output_path = convert_to_image(temp_file_path, OUTPUT_DIR, dpi, output_format, quality)
+        # 构建转换参数的唯一标识
+        conversion_key = f"{file_hash}_{dpi}_{output_format}_{quality}"
+        
+        # 检查是否已经处理过相同的文件和参数，先查会话缓存，再查磁盘缓存
+        actual_output_path = st.session_state.processed_files.get(conversion_key)
+        if not actual_output_path or not os.path.exists(actual_output_path):
+            actual_output_path = load_cached_result(os.path.join(RESULT_CACHE_DIR, conversion_key))
+        
+        if actual_output_path:
+            # 使用缓存的结果
+            st.success("使用缓存的转换结果")
+        else:
+            # 保存上传的文件到临时目录
+            if not os.path.exists(temp_file_path):
+                save_uploaded_file(uploaded_file, temp_file_path)
             
-            # 缓存结果
-            if actual_output_path:
-                st.session_state.processed_files[conversion_key] = actual_output_path
-        finally:
-            # 清理临时文件
-            if os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
+            # 执行转换
+            actual_output_path = convert_to_result_cache(temp_file_path, conversion_key, dpi, file_hash, output_format, quality)
+        
+        # 缓存结果
+        if actual_output_path:
+            st.session_state.processed_files[conversion_key] = actual_output_path
+    finally:
+        # 清理临时文件
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
     
     # 显示结果 - 使用优化的显示方案
     if actual_output_path and os.path.exists(actual_output_path):
-        # 导入优化的显示模块
-        from optimized_display import integrate_optimized_display
+        # 使用优化的显示模块
         integrate_optimized_display(actual_output_path, output_format, dpi, quality)
     else:
         st.error("图像转换失败，请检查文件格式或系统依赖")
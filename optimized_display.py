@@ -2,11 +2,283 @@
 优化的长图显示方案 - 解决预览过高和下载按钮位置问题
 """
 import streamlit as st
+import PIL
 from PIL import Image
 import os
-import base64
+import hashlib
+import functools
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 
+# Pillow-SIMD 以 .postN 后缀发布版本号，据此判断缩放等操作是否为 SIMD 实现
+PILLOW_SIMD = ".post" in PIL.__version__
+
+# 预览图解码后超过该大小（MB）时，在加载预览的勾选框中提示解码数据量
+PREVIEW_CONFIRM_MB = 100
+
+# 不超过该大小的输出文件在内存中缓存，重跑时下载按钮无需重新读盘；
+# 缓存为进程级，最多占用 DOWNLOAD_CACHE_MAX_ENTRIES × 该大小，空闲超过 TTL 后释放
+DOWNLOAD_CACHE_MAX_BYTES = 32 * 1024 * 1024
+DOWNLOAD_CACHE_MAX_ENTRIES = 4
+DOWNLOAD_CACHE_TTL = 600
+
+# 预览容器的静态样式，最大高度通过行内样式单独设置
+PREVIEW_CONTAINER_CSS = """
+<style>
+.preview-container {
+    overflow-y: auto;
+    border: 2px solid #f0f2f6;
+    border-radius: 10px;
+    padding: 10px;
+    background: white;
+    position: relative;
+}
+.ruler {
+    position: absolute;
+    left: 0;
+    top: 0;
+    width: 30px;
+    height: 100%;
+    background: linear-gradient(to bottom,
+        #f0f2f6 0px, #f0f2f6 1px,
+        transparent 1px, transparent 100px);
+    background-size: 100% 100px;
+    border-right: 1px solid #ddd;
+}
+</style>
+"""
+
+@functools.lru_cache(maxsize=None)
+def load_cv2():
+    """
+    按需导入 OpenCV（可选依赖），未安装时返回 None
+    
+    OpenCV 的导入耗时和内存占用都较大，只在首次需要缩放时加载；
+    PIL 在 main.py 中始终会被导入，延迟导入它没有收益
+    """
+    try:
+        import cv2  # OpenCV 的 SIMD 缩放，对超长图的缩放明显快于 PIL
+    except ImportError:
+        return None
+    return cv2
+
+def fast_resize(img, size, resample):
+    """缩放图像，安装 OpenCV 时使用其向量化实现，否则使用 PIL"""
+    cv2 = load_cv2()
+    if cv2 is None or img.mode != "RGB":
+        return img.resize(size, resample)
+    if size[0] <= img.width and size[1] <= img.height:
+        # 缩小时 INTER_AREA 按面积平均像素，不会像 LANCZOS4 固定的 8x8 邻域那样在大倍数缩小时产生混叠
+        interpolation = cv2.INTER_AREA
+    else:
+        interpolation = cv2.INTER_LANCZOS4 if resample == Image.Resampling.LANCZOS else cv2.INTER_LINEAR
+    return Image.fromarray(cv2.resize(np.asarray(img), size, interpolation=interpolation))
+
+@functools.lru_cache(maxsize=16)
+def lanczos_kernel(factor, lobes=3):
+    """整数倍缩小用的一维 Lanczos 滤波核，按缩小倍数缓存，只计算一次"""
+    x = np.arange(-lobes * factor + 1, lobes * factor) / factor
+    kernel = np.sinc(x) * np.sinc(x / lobes)
+    return (kernel / kernel.sum()).astype(np.float32)
+
+def decimate_lanczos(arr, factor):
+    """整数倍缩小：先用预先计算的可分离 Lanczos 核低通滤波，再按步长抽取像素"""
+    kernel = lanczos_kernel(factor)
+    filtered = load_cv2().sepFilter2D(arr, -1, kernel, kernel)
+    return filtered[factor // 2::factor, factor // 2::factor]
+
+@st.cache_resource
+def get_export_executor():
+    """另存为和导出缩放版本共用的后台线程池，避免阻塞界面"""
+    return ThreadPoolExecutor(max_workers=2)
+
+def export_image(source_path, dest_path, target_format, size=None):
+    """在后台线程中转换格式或缩放并保存图像，返回保存路径"""
+    with Image.open(source_path) as img:
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        if size is not None:
+            factor = img.width // size[0]
+            if load_cv2() is not None and factor > 1 and img.width == size[0] * factor:
+                # 整数倍缩小（如 50%、20%、10%）复用缓存的滤波核
+                img = Image.fromarray(np.ascontiguousarray(
+                    decimate_lanczos(np.asarray(img), factor)[:size[1], :size[0]]))
+            else:
+                img = fast_resize(img, size, Image.Resampling.LANCZOS)
+        if target_format == "PNG":
+            # 导出文件已是最终结果，使用最快的压缩级别
+            img.save(dest_path, "PNG", compress_level=1)
+        else:
+            img.save(dest_path, "JPEG", quality=85, optimize=False, progressive=False)
+    return dest_path
+
+def submit_export(label, source_path, dest_path, target_format, size=None):
+    """提交后台导出任务，任务状态保存在 session state 中"""
+    future = get_export_executor().submit(export_image, source_path, dest_path, target_format, size)
+    st.session_state.setdefault("export_jobs", {})[label] = future
+
+@st.fragment(run_every=1)
+def poll_export_jobs():
+    """每秒只重跑该片段检查进行中的任务；有任务结束时整页重跑一次，由 show_export_jobs 显示结果"""
+    export_jobs = st.session_state.get("export_jobs", {})
+    if any(future.done() for future in export_jobs.values()):
+        st.rerun()
+    for label in export_jobs:
+        st.info(f"⏳ 正在{label}...")
+
+def show_export_jobs():
+    """显示已结束任务的结果并将其移除；仍有任务进行中时才调用轮询片段，全部结束后不再定时重跑"""
+    export_jobs = st.session_state.get("export_jobs", {})
+    for label, future in list(export_jobs.items()):
+        if not future.done():
+            continue
+        if future.exception() is not None:
+            st.error(f"{label}失败: {future.exception()}")
+        else:
+            st.success(f"已{label}: {future.result()}")
+        # 结果已显示过一次，下次重跑不再显示
+        del export_jobs[label]
+    if export_jobs:
+        poll_export_jobs()
+
+@functools.lru_cache(maxsize=64)
+def stable_widget_key(prefix, value):
+    """基于内容的稳定组件 key，不受 Python 字符串哈希随机化影响"""
+    return f"{prefix}_{hashlib.blake2b(value.encode(), digest_size=8).hexdigest()}"
+
+def get_preview_path(output_path):
+    """合并时生成的预览图路径"""
+    return f"{os.path.splitext(output_path)[0]}_preview.jpg"
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def get_image_info(image_path, mtime):
+    """读取文件大小和图像尺寸，只解析文件头，按修改时间缓存"""
+    with Image.open(image_path) as img:
+        return os.path.getsize(image_path), img.size
+
+@st.cache_resource(max_entries=DOWNLOAD_CACHE_MAX_ENTRIES, ttl=DOWNLOAD_CACHE_TTL, show_spinner=False)
+def load_file_bytes(file_path, mtime, size):
+    """读取下载用的文件数据，同一文件只读取一次，缓存对象直接复用不复制"""
+    with open(file_path, "rb", buffering=1 << 20) as f:
+        return f.read()
+
+def get_download_data(file_path, file):
+    """
+    下载按钮的数据：较小的文件使用缓存数据，超大文件直接传入文件句柄
+    
+    st.download_button 只接受 bytes 或文件对象，并会把内容放入自身的媒体缓存，
+    因此无法传入 mmap/memoryview 实现零拷贝；文件句柄由 Streamlit 一次读入，
+    不会在脚本中额外保留一份副本
+    """
+    stat = os.stat(file_path)
+    if stat.st_size <= DOWNLOAD_CACHE_MAX_BYTES:
+        return load_file_bytes(file_path, stat.st_mtime, stat.st_size)
+    return file
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def create_thumbnail(image_path, mtime, max_size=150):
+    """创建 WebP 编码的缩略图用于快速预览，按文件路径和修改时间缓存"""
+    with Image.open(image_path) as img:
+        ratio = max_size / max(img.width, img.height)
+        new_size = (int(img.width * ratio), int(img.height * ratio))
+        img.draft("RGB", new_size)
+        # 150px 缩略图不需要 LANCZOS，BOX 的开销最低
+        thumb = img.resize(new_size, Image.Resampling.BOX)
+    
+    with BytesIO() as buffered:
+        thumb.convert("RGB").save(buffered, format="WEBP", quality=80, method=0)
+        return buffered.getvalue()
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def load_preview_pyramid(preview_path, mtime):
+    """解码预览图并用 reduce(2) 逐级减半构建金字塔，直到短边小于 256px"""
+    with Image.open(preview_path) as img:
+        level = img.convert("RGB")
+    pyramid = [level]
+    while min(level.size) // 2 >= 256:
+        level = level.reduce(2)
+        pyramid.append(level)
+    return pyramid
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def load_preview_array(preview_path, mtime, level):
+    """金字塔某一层级的像素数组，分段查看时直接取行切片，不复制像素"""
+    return np.asarray(load_preview_pyramid(preview_path, mtime)[level])
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def render_preview(preview_path, mtime, full_size, preview_mode, max_height, segment_idx, enhance_quality):
+    """按预览模式生成显示用图像，返回 WebP 数据和显示尺寸，按文件和预览参数缓存"""
+    full_width, full_height = full_size
+    # 预览只用于显示，默认使用快速的 BOX 缩放，高质量预览时使用 LANCZOS。
+    # 各滤波器每个输出像素的采样数随缩小倍数增长：BOX 约 1 倍、BILINEAR 约 2 倍、
+    # BICUBIC 约 4 倍、LANCZOS 约 6 倍，大倍数缩小时 BOX 与其他滤波器的视觉差异很小
+    resample = Image.Resampling.LANCZOS if enhance_quality else Image.Resampling.BOX
+    
+    # 根据预览模式计算目标显示尺寸
+    if preview_mode == "智能适应":
+        # 自动计算最佳显示尺寸：宽度不超过屏幕，高度不超过 800px，一次求出缩放比例
+        screen_width = 1200  # 假设的屏幕宽度
+        scale = min(1.0, screen_width / full_width, 800 / full_height)
+        target_size = (max(1, int(full_width * scale)), max(1, int(full_height * scale)))
+        
+    elif preview_mode == "固定高度":
+        # 固定高度，宽度按比例；原图不足该高度时不放大
+        scale = min(1.0, max_height / full_height)
+        new_width = int(full_width * scale)
+        target_size = (new_width, int(full_height * scale))
+        
+    elif preview_mode == "缩略图":
+        # 生成小缩略图
+        thumb_size = 400
+        scale = min(1.0, thumb_size / max(full_width, full_height))
+        new_width = int(full_width * scale)
+        new_height = int(full_height * scale)
+        target_size = (new_width, new_height)
+        
+    else:
+        # 分段查看时按显示宽度（最多 1200px）等比缩放
+        scale = min(1.0, 1200 / full_width)
+        target_size = (int(full_width * scale), int(full_height * scale))
+    
+    # 从不小于目标尺寸的最小层级缩放，读取的像素最少
+    pyramid = load_preview_pyramid(preview_path, mtime)
+    level = next((i for i in reversed(range(len(pyramid)))
+                  if pyramid[i].width >= target_size[0] and pyramid[i].height >= target_size[1]), 0)
+    preview_img = pyramid[level]
+    preview_scale = preview_img.height / full_height
+    
+    if preview_mode != "分段查看":
+        if target_size[0] >= preview_img.width and target_size[1] >= preview_img.height:
+            # 目标尺寸不小于源图时无需缩放，由浏览器负责显示缩放
+            display_img = preview_img
+        else:
+            display_img = fast_resize(preview_img, target_size, resample)
+    else:
+        # 分段显示（每段1000px高）
+        segment_height = 1000
+        start_y = segment_idx * segment_height
+        end_y = min(start_y + segment_height, full_height)
+        
+        # 在预览图数组上按比例取行切片，无需裁剪复制
+        rows = load_preview_array(preview_path, mtime, level)[int(start_y * preview_scale):int(end_y * preview_scale)]
+        
+        # 缩放到合适的显示尺寸
+        if rows.shape[1] > 1200:
+            new_size = (1200, max(1, int(rows.shape[0] * 1200 / rows.shape[1])))
+            cv2 = load_cv2()
+            if cv2 is not None:
+                display_img = Image.fromarray(cv2.resize(rows, new_size, interpolation=cv2.INTER_AREA))
+            else:
+                display_img = Image.fromarray(rows).resize(new_size, resample)
+        else:
+            display_img = Image.fromarray(rows)
+
+    # 预览只用于显示，使用最快的 WebP 编码（method=0），体积和耗时都远小于 PNG
+    with BytesIO() as buffered:
+        display_img.save(buffered, format="WEBP", quality=80, method=0)
+        return buffered.getvalue(), display_img.size
+
 def create_optimized_display(actual_output_path, output_format, dpi, quality):
     """
     创建优化的显示布局
@@ -23,20 +295,16 @@ def create_optimized_display(actual_output_path, output_format, dpi, quality):
         return
     
     # 获取文件信息
-    file_size = os.path.getsize(actual_output_path) / (1024 * 1024)  # MB
-    img = Image.open(actual_output_path)
-    
-    # 生成快速预览缩略图（Base64编码）
-    def create_thumbnail_base64(img, max_size=150):
-        """创建Base64编码的缩略图用于快速预览"""
-        ratio = max_size / max(img.width, img.height)
-        new_size = (int(img.width * ratio), int(img.height * ratio))
-        thumb = img.resize(new_size, Image.Resampling.LANCZOS)
-        
-        buffered = BytesIO()
-        thumb.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-        return f"data:image/png;base64,{img_str}"
+    output_mtime = os.path.getmtime(actual_output_path)
+    file_bytes, (width, height) = get_image_info(actual_output_path, output_mtime)
+    file_size = file_bytes / (1024 * 1024)  # MB
+    # 分段查看的段数（每段 1000px，向上取整，最多 5 段）
+    n_segments = min(5, (height + 999) // 1000)
+    # 预览优先使用合并时生成的小图，避免为显示而解码整张长图
+    preview_path = get_preview_path(actual_output_path)
+    if not os.path.exists(preview_path):
+        preview_path = actual_output_path
+    preview_mtime = os.path.getmtime(preview_path)
     
     # 1. 成功提示和关键信息（固定在顶部）
     success_container = st.container()
@@ -49,31 +317,28 @@ def create_optimized_display(actual_output_path, output_format, dpi, quality):
         
         with col_thumb:
             # 显示小缩略图
-            thumb_base64 = create_thumbnail_base64(img)
-            st.markdown(
-                f'<img src="{thumb_base64}" style="width:100%; max-width:150px; border-radius:10px; box-shadow: 0 2px 8px rgba(0,0,0,0.1);">',
-                unsafe_allow_html=True
-            )
+            # 直接传入 WebP 数据，无需 Base64 编码后嵌入 HTML
+            st.image(create_thumbnail(preview_path, preview_mtime), width=150)
         
         with col_info:
-            st.markdown("**📊 文件信息**")
-            st.caption(f"• 尺寸: {img.width:,} × {img.height:,} px")
-            st.caption(f"• 大小: {file_size:.1f} MB")
-            st.caption(f"• 格式: {output_format}")
-            st.caption(f"• DPI: {dpi}")
+            # 合并为一次 markdown 输出，减少每次重跑的前端消息和节点数
+            st.markdown(f"**📊 文件信息**\n\n"
+                        f"- 尺寸: {width:,} × {height:,} px  \n"
+                        f"- 大小: {file_size:.1f} MB  \n"
+                        f"- 格式: {output_format}  \n"
+                        f"- DPI: {dpi}")
         
         with col_actions:
             # 主要下载按钮
-            with open(actual_output_path, "rb") as file:
-                file_data = file.read()
+            with open(actual_output_path, "rb", buffering=1 << 20) as file:
                 st.download_button(
                     label="⬇️ 下载完整图片",
-                    data=file_data,
+                    data=get_download_data(actual_output_path, file),
                     file_name=os.path.basename(actual_output_path),
                     mime=f"image/{output_format.lower()}",
                     use_container_width=True,
                     type="primary",
-                    key=f"download_main_{hash(actual_output_path)}"
+                    key=stable_widget_key("download_main", actual_output_path)
                 )
             
             # 次要操作按钮
@@ -92,138 +357,67 @@ def create_optimized_display(actual_output_path, output_format, dpi, quality):
     # 分隔线
     st.markdown("---")
     
-    # 2. 预览控制区域
-    preview_container = st.container()
+    # 2. 预览控制区域。折叠的 expander 仍会执行其中的代码，
+    # 因此由勾选框决定是否解码预览，只下载文件时不生成预览
+    preview_container = st.expander("🖼️ 图片预览", expanded=False)
     with preview_container:
-        st.markdown("### 🖼️ 图片预览")
-        
-        # 预览选项
-        preview_col1, preview_col2, preview_col3 = st.columns(3)
+        # 预览图很大时在勾选框中提示需要解码的数据量
+        _, (preview_width, preview_height) = get_image_info(preview_path, preview_mtime)
+        decoded_mb = preview_width * preview_height * 3 / (1024 * 1024)
+        load_label = (f"加载预览（需要解码约 {decoded_mb:.0f} MB 像素数据）"
+                      if decoded_mb > PREVIEW_CONFIRM_MB else "加载预览")
+        if not st.checkbox(load_label, key=stable_widget_key("load_preview", actual_output_path)):
+            st.caption("勾选后生成预览")
+        else:
+            # 预览选项
+            preview_col1, preview_col2, preview_col3 = st.columns(3)
+            max_height = 600
+            segment_idx = 0
         
-        with preview_col1:
-            preview_mode = st.selectbox(
-                "预览模式",
-                ["智能适应", "固定高度", "缩略图", "分段查看"],
-                help="选择不同的预览方式"
-            )
+            with preview_col1:
+                preview_mode = st.selectbox(
+                    "预览模式",
+                    ["智能适应", "固定高度", "缩略图", "分段查看"],
+                    help="选择不同的预览方式"
+                )
         
-        with preview_col2:
-            if preview_mode == "固定高度":
-                max_height = st.slider("最大高度", 300, 1000, 600, 50)
-            elif preview_mode == "分段查看":
-                segment = st.selectbox("选择段落", 
-                    [f"第 {i+1} 段" for i in range(min(5, img.height // 1000 + 1))])
-                segment_idx = int(segment.split()[1]) - 1
-            else:
-                max_height = 600
-                segment_idx = 0
+            with preview_col2:
+                if preview_mode == "固定高度":
+                    max_height = st.slider("最大高度", 300, 1000, 600, 50)
+                elif preview_mode == "分段查看":
+                    segment = st.selectbox("选择段落", 
+                        [f"第 {i+1} 段" for i in range(n_segments)])
+                    segment_idx = int(segment.split()[1]) - 1
         
-        with preview_col3:
-            show_ruler = st.checkbox("显示标尺", False)
-            enhance_quality = st.checkbox("高质量预览", False)
+            with preview_col3:
+                show_ruler = st.checkbox("显示标尺", False)
+                enhance_quality = st.checkbox("高质量预览", False)
         
-        # 3. 图片预览区域
-        preview_area = st.container()
-        with preview_area:
-            # 根据预览模式处理图片
-            if preview_mode == "智能适应":
-                # 自动计算最佳显示尺寸
-                screen_width = 1200  # 假设的屏幕宽度
-                if img.width > screen_width:
-                    scale = screen_width / img.width
-                    new_width = screen_width
-                    new_height = int(img.height * scale)
-                else:
-                    new_width = img.width
-                    new_height = img.height
-                
-                # 限制最大高度
-                if new_height > 800:
-                    scale = 800 / new_height
-                    new_height = 800
-                    new_width = int(new_width * scale)
-                
-                display_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                
-            elif preview_mode == "固定高度":
-                # 固定高度，宽度按比例
-                scale = max_height / img.height
-                new_width = int(img.width * scale)
-                display_img = img.resize((new_width, max_height), Image.Resampling.LANCZOS)
-                
-            elif preview_mode == "缩略图":
-                # 生成小缩略图
-                thumb_size = 400
-                scale = thumb_size / max(img.width, img.height)
-                new_width = int(img.width * scale)
-                new_height = int(img.height * scale)
-                display_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                
-            elif preview_mode == "分段查看":
-                # 分段显示（每段1000px高）
-                segment_height = 1000
-                start_y = segment_idx * segment_height
-                end_y = min(start_y + segment_height, img.height)
-                
-                # 裁剪图片段
-                segment_img = img.crop((0, start_y, img.width, end_y))
-                
-                # 缩放到合适的显示尺寸
-                if segment_img.width > 1200:
-                    scale = 1200 / segment_img.width
-                    new_width = 1200
-                    new_height = int(segment_img.height * scale)
-                    display_img = segment_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                else:
-                    display_img = segment_img
+            # 3. 图片预览区域
+            preview_area = st.container()
+            with preview_area:
+                # 预览图按文件和参数缓存，切换标尺等选项时不再重新缩放
+                preview_data, display_size = render_preview(
+                    preview_path, preview_mtime, (width, height), preview_mode, max_height, segment_idx, enhance_quality)
             
-            # 如果选择高质量预览，使用更好的重采样
-            if enhance_quality and hasattr(display_img, 'resize'):
-                # 确保使用最高质量的重采样算法
-                pass  # 已经使用LANCZOS
-            
-            # 创建可滚动的容器显示图片
-            if preview_mode != "缩略图":
-                # 使用自定义HTML创建可滚动容器
-                st.markdown(
-                    f"""
-                    <style>
-                    .preview-container {{
-                        max-height: {max_height if preview_mode == "固定高度" else 800}px;
-                        overflow-y: auto;
-                        border: 2px solid #f0f2f6;
-                        border-radius: 10px;
-                        padding: 10px;
-                        background: white;
-                        position: relative;
-                    }}
-                    .ruler {{
-                        position: absolute;
-                        left: 0;
-                        top: 0;
-                        width: 30px;
-                        height: 100%;
-                        background: linear-gradient(to bottom,
-                            #f0f2f6 0px, #f0f2f6 1px,
-                            transparent 1px, transparent 100px);
-                        background-size: 100% 100px;
-                        border-right: 1px solid #ddd;
-                    }}
-                    </style>
-                    <div class="preview-container">
-                        {"<div class='ruler'></div>" if show_ruler else ""}
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
+                # 创建可滚动的容器显示图片
+                if preview_mode != "缩略图":
+                    # 使用自定义HTML创建可滚动容器，样式为固定文本，只有高度和标尺随参数变化
+                    container_height = max_height if preview_mode == "固定高度" else 800
+                    ruler_html = "<div class='ruler'></div>" if show_ruler else ""
+                    st.markdown(
+                        PREVIEW_CONTAINER_CSS
+                        + f'<div class="preview-container" style="max-height: {container_height}px;">{ruler_html}</div>',
+                        unsafe_allow_html=True
+                    )
             
-            # 显示处理后的图片
-            caption = f"预览模式: {preview_mode}"
-            if preview_mode == "分段查看":
-                caption += f" - 第 {segment_idx + 1}/{img.height // 1000 + 1} 段"
-            caption += f" | 显示尺寸: {display_img.width}×{display_img.height}px"
+                # 显示处理后的图片
+                caption = f"预览模式: {preview_mode}"
+                if preview_mode == "分段查看":
+                    caption += f" - 第 {segment_idx + 1}/{n_segments} 段"
+                caption += f" | 显示尺寸: {display_size[0]}×{display_size[1]}px"
             
-            st.image(display_img, caption=caption, use_container_width=True)
+                st.image(preview_data, caption=caption, use_container_width=True)
     
     # 4. 快速操作工具栏（浮动在底部）
     st.markdown("---")
@@ -239,30 +433,33 @@ def create_optimized_display(actual_output_path, output_format, dpi, quality):
                 if output_format != "PNG":
                     # 转换为PNG
                     png_path = actual_output_path.replace(f".{output_format.lower()}", ".png")
-                    img.save(png_path, "PNG", optimize=True)
-                    st.success(f"已保存为: {png_path}")
+                    submit_export("另存为 PNG", actual_output_path, png_path, "PNG")
         
         with tool_col2:
             if st.button("🎨 另存为 JPG", use_container_width=True):
                 if output_format != "JPG":
                     # 转换为JPG
                     jpg_path = actual_output_path.replace(f".{output_format.lower()}", ".jpg")
-                    img.convert("RGB").save(jpg_path, "JPEG", quality=85)
-                    st.success(f"已保存为: {jpg_path}")
+                    submit_export("另存为 JPG", actual_output_path, jpg_path, "JPG")
         
         with tool_col3:
             if st.button("📏 查看原始尺寸", use_container_width=True):
-                st.info(f"原始尺寸: {img.width:,} × {img.height:,} 像素\n"
-                       f"宽高比: {img.width/img.height:.2f}")
+                st.info(f"原始尺寸: {width:,} × {height:,} 像素\n"
+                       f"宽高比: {width/height:.2f}")
         
         with tool_col4:
             if st.button("🗑️ 清理缓存", use_container_width=True):
                 if 'processed_files' in st.session_state:
                     st.session_state.processed_files.clear()
                 st.success("缓存已清理")
+        
+        # 后台导出任务的进度和结果显示在这里，等高级选项中的导出按钮也提交任务后再填充
+        export_status = st.container()
     
     # 5. 高级选项（折叠）
     with st.expander("🔧 高级选项"):
+        st.caption(f"图像处理库：Pillow {PIL.__version__}" + ("（Pillow-SIMD 加速）" if PILLOW_SIMD else "")
+                   + ("，OpenCV 缩放已启用" if load_cv2() is not None else ""))
         adv_col1, adv_col2 = st.columns(2)
         
         with adv_col1:
@@ -270,16 +467,12 @@ def create_optimized_display(actual_output_path, output_format, dpi, quality):
             export_scale = st.slider("导出缩放比例", 10, 100, 100, 10)
             if st.button("导出缩放版本"):
                 scale = export_scale / 100
-                scaled_img = img.resize(
-                    (int(img.width * scale), int(img.height * scale)),
-                    Image.Resampling.LANCZOS
-                )
                 scaled_path = actual_output_path.replace(
                     f".{output_format.lower()}", 
                     f"_scaled_{export_scale}.{output_format.lower()}"
                 )
-                scaled_img.save(scaled_path)
-                st.success(f"已导出: {scaled_path}")
+                submit_export(f"导出缩放版本（{export_scale}%）", actual_output_path, scaled_path,
+                              output_format, (int(width * scale), int(height * scale)))
         
         with adv_col2:
             st.markdown("**分享选项**")
@@ -290,6 +483,9 @@ def create_optimized_display(actual_output_path, output_format, dpi, quality):
             if st.button("生成二维码"):
                 # 可以生成包含下载链接的二维码
                 st.info("二维码功能正在开发中...")
+    
+    with export_status:
+        show_export_jobs()
 
 def integrate_optimized_display(actual_output_path, output_format, dpi, quality):
     """
@@ -302,10 +498,10 @@ def integrate_optimized_display(actual_output_path, output_format, dpi, quality)
         st.error(f"显示错误: {str(e)}")
         # 降级处理 - 显示基本的下载按钮
         if actual_output_path and os.path.exists(actual_output_path):
-            with open(actual_output_path, "rb") as file:
+            with open(actual_output_path, "rb", buffering=1 << 20) as file:
                 st.download_button(
                     label="下载生成的图像",
-                    data=file.read(),
+                    data=get_download_data(actual_output_path, file),
                     file_name=os.path.basename(actual_output_path),
                     mime=f"image/{output_format.lower()}"
                 )
\ No newline at end of file
@@ -8,127 +8,43 @@ import io
 import time
 import base64
 import threading
-from PIL import Image, ImageFilter
+import numpy as np
+from PIL import Image, features
 import streamlit as st
 import streamlit.components.v1 as components
 from typing import Dict, List, Tuple, Optional
 import json
+import string
 from concurrent.futures import ThreadPoolExecutor
 import queue
 
-class AdaptiveQualityStreaming:
-    def __init__(self, image_path: str):
-        self.image_path = image_path
-        self.base_name = os.path.splitext(os.path.basename(image_path))[0]
-        self.cache_dir = os.path.join("adaptive_cache", self.base_name)
-        os.makedirs(self.cache_dir, exist_ok=True)
-        
-        # 获取图像信息
-        with Image.open(image_path) as img:
-            self.original_width, self.original_height = img.size
-            self.aspect_ratio = self.original_height / self.original_width
-        
-        # 质量级别配置
-        self.quality_levels = {
-            'ultra_low': {'scale': 0.1, 'quality': 30, 'blur_radius': 2},
-            'low': {'scale': 0.25, 'quality': 45, 'blur_radius': 1},
-            'medium': {'scale': 0.5, 'quality': 65, 'blur_radius': 0},
-            'high': {'scale': 0.75, 'quality': 80, 'blur_radius': 0},
-            'ultra_high': {'scale': 1.0, 'quality': 95, 'blur_radius': 0}
-        }
-        
-        # 设备性能评估参数
-        self.device_capabilities = {
-            'mobile': {'max_width': 800, 'preferred_quality': 'medium'},
-            'tablet': {'max_width': 1200, 'preferred_quality': 'high'}, 
-            'desktop': {'max_width': 2000, 'preferred_quality': 'ultra_high'},
-            'high_end': {'max_width': 4000, 'preferred_quality': 'ultra_high'}
-        }
-    
-    def detect_device_capability(self) -> str:
-        """基于图像尺寸和用户代理检测设备性能级别"""
-        # 简化的设备检测逻辑
-        if self.original_width > 3000 or self.original_height > 20000:
-            return 'high_end'
-        elif self.original_width > 2000:
-            return 'desktop'
-        elif self.original_width > 1000:
-            return 'tablet'
-        else:
-            return 'mobile'
-    
-    def generate_progressive_versions(self) -> Dict[str, str]:
-        """生成渐进式质量版本"""
-        versions = {}
-        device_type = self.detect_device_capability()
-        max_width = self.device_capabilities[device_type]['max_width']
-        
-        try:
-            with Image.open(self.image_path) as original_img:
-                # 限制最大宽度
-                if self.original_width > max_width:
-                    scale_factor = max_width / self.original_width
-                    target_width = max_width
-                    target_height = int(self.original_height * scale_factor)
-                    base_img = original_img.resize((target_width, target_height), Image.Resampling.LANCZOS)
-                else:
-                    base_img = original_img
-                    target_width, target_height = self.original_width, self.original_height
-                
-                for level_name, config in self.quality_levels.items():
-                    version_path = os.path.join(self.cache_dir, f"{level_name}_{target_width}x{target_height}.jpg")
-                    
-                    if not os.path.exists(version_path):
-                        # 计算当前级别的尺寸
-                        level_width = int(target_width * config['scale'])
-                        level_height = int(target_height * config['scale'])
-                        
-                        # 缩放图像
-                        level_img = base_img.resize((level_width, level_height), Image.Resampling.LANCZOS)
-                        
-                        # 应用模糊效果（低质量版本）
-                        if config['blur_radius'] > 0:
-                            level_img = level_img.filter(ImageFilter.GaussianBlur(radius=config['blur_radius']))
-                        
-                        # 保存为渐进式JPEG
-                        level_img.convert('RGB').save(
-                            version_path, 
-                            'JPEG', 
-                            quality=config['quality'],
-                            progressive=True,
-                            optimize=True
-                        )
-                    
-                    versions[level_name] = version_path
-                
-            return versions
-            
-        except Exception as e:
-            st.error(f"生成渐进式版本失败: {str(e)}")
-            return {}
-    
-    def get_streaming_html(self, versions: Dict[str, str]) -> str:
-        """生成自适应质量流式加载的HTML"""
-        
-        # 转换图像路径为base64
-        versions_b64 = {}
-        for level, path in versions.items():
-            try:
-                with open(path, 'rb') as f:
-                    data = f.read()
-                    versions_b64[level] = base64.b64encode(data).decode()
-            except:
-                continue
-        
-        versions_json = json.dumps(versions_b64)
-        quality_config_json = json.dumps(self.quality_levels)
-        
-        html_code = f"""
+try:
+    # 可选依赖：libjpeg-turbo 的 SIMD 编码器，直接编码 NumPy 缓冲区
+    from turbojpeg import TurboJPEG, TJPF_RGB, TJFLAG_PROGRESSIVE
+    turbo_jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    turbo_jpeg = None
+
+try:
+    import pybase64 as b64  # 可选依赖：SIMD 实现的 base64，内嵌大图时编码更快
+except ImportError:
+    b64 = base64
+
+# 质量级别写在 Streamlit 的 static/ 目录下，开启静态文件服务后浏览器可直接通过 URL 获取
+STATIC_DIR = "static"
+STATIC_URL = "/app/static"
+
+# 质量级别优先保存为 WebP（同等观感下比 JPEG 小约三成），Pillow 未编译 WebP 支持时退回渐进式 JPEG
+VERSION_FORMAT = 'WEBP' if features.check('webp') else 'JPEG'
+VERSION_EXT = '.webp' if VERSION_FORMAT == 'WEBP' else '.jpg'
+
+# 查看器页面模板在导入时编译一次，渲染时只替换两处数据；页面中的 JS 模板字符串用 $$ 转义
+STREAMING_HTML_TEMPLATE = string.Template("""
         <!DOCTYPE html>
         <html>
         <head>
             <style>
-                .adaptive-container {{
+                .adaptive-container {
                     position: relative;
                     width: 100%;
                     max-height: 80vh;
@@ -136,24 +52,24 @@ class AdaptiveQualityStreaming:
                     border-radius: 12px;
                     overflow: hidden;
                     background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                }}
+                }
                 
-                .image-viewport {{
+                .image-viewport {
                     position: relative;
                     width: 100%;
                     max-height: 80vh;
                     overflow: auto;
                     background: #000;
-                }}
+                }
                 
-                .progressive-image {{
+                .progressive-image {
                     width: 100%;
                     height: auto;
                     display: block;
                     transition: filter 0.3s ease, opacity 0.3s ease;
-                }}
+                }
                 
-                .loading-overlay {{
+                .loading-overlay {
                     position: absolute;
                     top: 0;
                     left: 0;
@@ -166,9 +82,9 @@ class AdaptiveQualityStreaming:
                     color: white;
                     font-size: 16px;
                     z-index: 100;
-                }}
+                }
                 
-                .quality-indicator {{
+                .quality-indicator {
                     position: absolute;
                     top: 15px;
                     left: 15px;
@@ -180,18 +96,18 @@ class AdaptiveQualityStreaming:
                     font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
                     z-index: 200;
                     box-shadow: 0 2px 10px rgba(0,0,0,0.3);
-                }}
+                }
                 
-                .quality-controls {{
+                .quality-controls {
                     position: absolute;
                     bottom: 15px;
                     left: 15px;
                     display: flex;
                     gap: 8px;
                     z-index: 200;
-                }}
+                }
                 
-                .quality-btn {{
+                .quality-btn {
                     padding: 8px 12px;
                     border: none;
                     border-radius: 20px;
@@ -202,20 +118,20 @@ class AdaptiveQualityStreaming:
                     font-weight: 500;
                     transition: all 0.2s ease;
                     box-shadow: 0 2px 8px rgba(0,0,0,0.2);
-                }}
+                }
                 
-                .quality-btn:hover {{
+                .quality-btn:hover {
                     background: white;
                     transform: translateY(-1px);
                     box-shadow: 0 4px 12px rgba(0,0,0,0.3);
-                }}
+                }
                 
-                .quality-btn.active {{
+                .quality-btn.active {
                     background: #4CAF50;
                     color: white;
-                }}
+                }
                 
-                .loading-progress {{
+                .loading-progress {
                     position: absolute;
                     bottom: 0;
                     left: 0;
@@ -223,9 +139,9 @@ class AdaptiveQualityStreaming:
                     background: #4CAF50;
                     transition: width 0.3s ease;
                     z-index: 300;
-                }}
+                }
                 
-                .network-indicator {{
+                .network-indicator {
                     position: absolute;
                     top: 15px;
                     right: 15px;
@@ -235,20 +151,20 @@ class AdaptiveQualityStreaming:
                     border-radius: 15px;
                     font-size: 10px;
                     z-index: 200;
-                }}
+                }
                 
-                .auto-enhance {{
+                .auto-enhance {
                     filter: contrast(1.05) saturate(1.1) brightness(1.02);
-                }}
+                }
                 
-                @keyframes pulse {{
-                    0%, 100% {{ opacity: 0.8; }}
-                    50% {{ opacity: 1; }}
-                }}
+                @keyframes pulse {
+                    0%, 100% { opacity: 0.8; }
+                    50% { opacity: 1; }
+                }
                 
-                .loading {{
+                .loading {
                     animation: pulse 2s infinite;
-                }}
+                }
             </style>
         </head>
         <body>
@@ -281,8 +197,8 @@ class AdaptiveQualityStreaming:
             </div>
             
             <script>
-                class AdaptiveImageLoader {{
-                    constructor(versions, qualityConfig) {{
+                class AdaptiveImageLoader {
+                    constructor(versions, qualityConfig) {
                         this.versions = versions;
                         this.qualityConfig = qualityConfig;
                         this.currentQuality = 'ultra_low';
@@ -296,172 +212,409 @@ class AdaptiveQualityStreaming:
                         this.loadingProgress = document.getElementById('loadingProgress');
                         
                         this.init();
-                    }}
+                    }
                     
-                    async init() {{
+                    async init() {
                         await this.detectNetworkSpeed();
                         this.startProgressiveLoading();
-                    }}
+                    }
                     
-                    async detectNetworkSpeed() {{
+                    async detectNetworkSpeed() {
                         const startTime = performance.now();
                         
-                        try {{
+                        try {
                             // 使用最小图像测试网络速度
                             const testImage = new Image();
-                            await new Promise((resolve, reject) => {{
+                            await new Promise((resolve, reject) => {
                                 testImage.onload = resolve;
                                 testImage.onerror = reject;
-                                testImage.src = 'data:image/jpeg;base64,' + this.versions.ultra_low;
-                            }});
+                                testImage.src = this.versions.ultra_low;
+                            });
                             
                             const loadTime = performance.now() - startTime;
                             const networkSpeed = this.estimateNetworkSpeed(loadTime);
                             
-                            this.networkIndicator.textContent = `网络: ${{networkSpeed}}`;
+                            this.networkIndicator.textContent = `网络: $${networkSpeed}`;
                             
                             // 根据网络速度调整初始质量
-                            if (this.autoMode) {{
+                            if (this.autoMode) {
                                 this.currentQuality = this.selectOptimalQuality(loadTime);
-                            }}
+                            }
                             
-                        }} catch (error) {{
+                        } catch (error) {
                             this.networkIndicator.textContent = '网络: 未知';
-                        }}
-                    }}
+                        }
+                    }
                     
-                    estimateNetworkSpeed(loadTime) {{
+                    estimateNetworkSpeed(loadTime) {
                         if (loadTime < 100) return '极快';
                         if (loadTime < 300) return '快速';
                         if (loadTime < 800) return '中等';
                         if (loadTime < 2000) return '较慢';
                         return '慢速';
-                    }}
+                    }
                     
-                    selectOptimalQuality(networkLoadTime) {{
+                    selectOptimalQuality(networkLoadTime) {
                         if (networkLoadTime < 200) return 'ultra_high';
                         if (networkLoadTime < 500) return 'high';
                         if (networkLoadTime < 1000) return 'medium';
                         if (networkLoadTime < 2000) return 'low';
                         return 'ultra_low';
-                    }}
+                    }
                     
-                    async startProgressiveLoading() {{
+                    async waitForVersion(quality) {
+                        // 其余级别在后台生成，用 HEAD 请求轮询，文件就绪后再加载
+                        const src = this.versions[quality];
+                        if (!src || src.startsWith('data:')) return !!src;
+                        for (let attempt = 0; attempt < 120; attempt++) {
+                            try {
+                                const response = await fetch(src, { method: 'HEAD', cache: 'no-store' });
+                                if (response.ok) return true;
+                            } catch (error) {}
+                            await new Promise(resolve => setTimeout(resolve, 1000));
+                        }
+                        return false;
+                    }
+                    
+                    async startProgressiveLoading() {
                         const qualitySequence = ['ultra_low', 'low', 'medium', 'high', 'ultra_high'];
                         let targetIndex = qualitySequence.indexOf(this.currentQuality);
                         
-                        for (let i = 0; i <= targetIndex; i++) {{
+                        for (let i = 0; i <= targetIndex; i++) {
                             const quality = qualitySequence[i];
-                            if (this.versions[quality]) {{
+                            if (await this.waitForVersion(quality)) {
                                 await this.loadQualityLevel(quality, i, targetIndex);
-                            }}
-                        }}
-                    }}
+                            }
+                        }
+                    }
                     
-                    async loadQualityLevel(quality, currentIndex, targetIndex) {{
-                        return new Promise((resolve) => {{
+                    async loadQualityLevel(quality, currentIndex, targetIndex) {
+                        return new Promise((resolve) => {
                             this.loadStartTime = performance.now();
                             
                             const img = new Image();
-                            img.onload = () => {{
+                            img.onload = () => {
                                 this.imageElement.src = img.src;
                                 this.updateQualityIndicator(quality);
                                 this.updateProgress(currentIndex, targetIndex);
                                 
-                                if (currentIndex === targetIndex) {{
+                                if (currentIndex === targetIndex) {
                                     this.finishLoading();
-                                }}
+                                }
                                 
                                 // 自动增强效果
-                                if (quality === 'ultra_high') {{
+                                if (quality === 'ultra_high') {
                                     this.imageElement.classList.add('auto-enhance');
-                                }}
+                                }
                                 
                                 resolve();
-                            }};
+                            };
                             
-                            img.src = 'data:image/jpeg;base64,' + this.versions[quality];
-                        }});
-                    }}
+                            img.src = this.versions[quality];
+                        });
+                    }
                     
-                    updateQualityIndicator(quality) {{
-                        const labels = {{
+                    updateQualityIndicator(quality) {
+                        const labels = {
                             'ultra_low': '极速模式 (模糊预览)',
                             'low': '快速模式 (低质量)',
                             'medium': '标准模式 (平衡)',
                             'high': '高清模式 (高质量)',
                             'ultra_high': '原画模式 (最高质量)'
-                        }};
+                        };
                         
                         this.qualityIndicator.textContent = labels[quality] || quality;
-                    }}
+                    }
                     
-                    updateProgress(current, target) {{
+                    updateProgress(current, target) {
                         const progress = ((current + 1) / (target + 1)) * 100;
                         this.loadingProgress.style.width = progress + '%';
-                    }}
+                    }
                     
-                    finishLoading() {{
-                        setTimeout(() => {{
+                    finishLoading() {
+                        setTimeout(() => {
                             this.loadingOverlay.style.opacity = '0';
-                            setTimeout(() => {{
+                            setTimeout(() => {
                                 this.loadingOverlay.style.display = 'none';
                                 this.loadingProgress.style.display = 'none';
-                            }}, 300);
-                        }}, 500);
-                    }}
+                            }, 300);
+                        }, 500);
+                    }
                     
-                    setQuality(quality) {{
-                        if (this.versions[quality]) {{
+                    setQuality(quality) {
+                        if (this.versions[quality]) {
                             this.currentQuality = quality;
                             this.autoMode = false;
-                            this.imageElement.src = 'data:image/jpeg;base64,' + this.versions[quality];
-                            this.updateQualityIndicator(quality);
                             
                             // 更新按钮状态
-                            document.querySelectorAll('.quality-btn').forEach(btn => {{
+                            document.querySelectorAll('.quality-btn').forEach(btn => {
                                 btn.classList.remove('active');
-                            }});
+                            });
                             event.target.classList.add('active');
-                        }}
-                    }}
+                            
+                            // 目标级别尚未生成时保持当前画面，就绪后再切换
+                            this.waitForVersion(quality).then(ready => {
+                                if (ready && this.currentQuality === quality) {
+                                    this.imageElement.src = this.versions[quality];
+                                    this.updateQualityIndicator(quality);
+                                }
+                            });
+                        }
+                    }
                     
-                    toggleAutoMode() {{
+                    toggleAutoMode() {
                         this.autoMode = !this.autoMode;
                         const btn = event.target;
                         
-                        if (this.autoMode) {{
+                        if (this.autoMode) {
                             btn.style.background = '#4CAF50';
                             btn.style.color = 'white';
                             this.detectNetworkSpeed().then(() => this.startProgressiveLoading());
-                        }} else {{
+                        } else {
                             btn.style.background = 'rgba(255,255,255,0.9)';
                             btn.style.color = '#333';
-                        }}
-                    }}
-                }}
+                        }
+                    }
+                }
                 
                 // 全局函数
                 let loader;
                 
-                function setQuality(quality) {{
+                function setQuality(quality) {
                     if (loader) loader.setQuality(quality);
-                }}
+                }
                 
-                function toggleAutoMode() {{
+                function toggleAutoMode() {
                     if (loader) loader.toggleAutoMode();
-                }}
+                }
                 
                 // 初始化
-                const versions = {versions_json};
-                const qualityConfig = {quality_config_json};
+                const versions = $VERSIONS_JSON;
+                const qualityConfig = $QUALITY_CONFIG_JSON;
                 loader = new AdaptiveImageLoader(versions, qualityConfig);
             </script>
         </body>
         </html>
-        """
+        """)
+
+def encode_level(level_img: Image.Image, config: Dict, version_path: str) -> str:
+    """对单个质量级别做模糊和编码，可在工作线程中并行执行"""
+    # 先写临时文件再替换，后台生成时页面不会读到写了一半的文件
+    part_path = version_path + '.part'
+    
+    # 应用模糊效果（低质量版本）：先缩小再双线性放大回原尺寸，近似高斯模糊但计算量小得多
+    if config['blur_radius'] > 0:
+        shrink = max(1, config['blur_radius'] * 2)
+        small_size = (max(1, level_img.width // shrink), max(1, level_img.height // shrink))
+        level_img = level_img.resize(small_size, Image.Resampling.BILINEAR).resize(level_img.size, Image.Resampling.BILINEAR)
+    
+    if VERSION_FORMAT == 'WEBP':
+        # method=4 在编码速度和体积之间折中
+        level_img.convert('RGB').save(part_path, 'WEBP', quality=config['quality'], method=4)
+        os.replace(part_path, version_path)
+        return version_path
+    
+    if turbo_jpeg is not None:
+        # 直接从 NumPy 数组编码，省去 PIL 到 libjpeg 的缓冲区拷贝
+        level_arr = np.asarray(level_img)
+        jpeg_data = turbo_jpeg.encode(level_arr, quality=config['quality'], pixel_format=TJPF_RGB,
+                                      flags=TJFLAG_PROGRESSIVE)
+        with open(part_path, 'wb') as f:
+            f.write(jpeg_data)
+        os.replace(part_path, version_path)
+        return version_path
+    
+    # 保存为渐进式JPEG；模糊占位图本身很小，省掉 optimize 的第二遍哈夫曼编码
+    level_img.convert('RGB').save(
+        part_path, 
+        'JPEG', 
+        quality=config['quality'],
+        progressive=True,
+        optimize=config['blur_radius'] == 0
+    )
+    os.replace(part_path, version_path)
+    return version_path
+
+def is_progressive_jpeg(path: str) -> bool:
+    """只读文件头部 64KB，判断 SOF2（渐进式）标记是否出现在 SOF0（基线）之前"""
+    with open(path, 'rb') as f:
+        head = f.read(65535)
+    sof2 = head.find(b'\xff\xc2')
+    sof0 = head.find(b'\xff\xc0')
+    return sof2 != -1 and (sof0 == -1 or sof2 < sof0)
+
+@st.cache_data(show_spinner=False)
+def encode_file_base64(path: str, mtime: float) -> str:
+    """读取并 base64 编码版本文件，按修改时间缓存，重新生成后自动失效"""
+    with open(path, 'rb') as f:
+        return b64.b64encode(f.read()).decode()
+
+class AdaptiveQualityStreaming:
+    def __init__(self, image_path: str):
+        self.image_path = image_path
+        self.base_name = os.path.splitext(os.path.basename(image_path))[0]
+        self.cache_dir = os.path.join(STATIC_DIR, "adaptive_cache", self.base_name)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        
+        # 获取图像信息：缓存目录中的 manifest.json 与源文件修改时间一致时直接复用，避免每次重跑都打开图像
+        self.mtime = os.path.getmtime(image_path)
+        manifest_path = os.path.join(self.cache_dir, "manifest.json")
+        manifest = None
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        if manifest and manifest.get('mtime') == self.mtime:
+            self.original_width, self.original_height = manifest['width'], manifest['height']
+        else:
+            with Image.open(image_path) as img:
+                self.original_width, self.original_height = img.size
+            with open(manifest_path, 'w', encoding='utf-8') as f:
+                json.dump({'mtime': self.mtime, 'width': self.original_width, 'height': self.original_height}, f)
+        self.aspect_ratio = self.original_height / self.original_width
+        
+        # 质量级别配置
+        self.quality_levels = {
+            'ultra_low': {'scale': 0.1, 'quality': 30, 'blur_radius': 2},
+            'low': {'scale': 0.25, 'quality': 45, 'blur_radius': 1},
+            'medium': {'scale': 0.5, 'quality': 65, 'blur_radius': 0},
+            'high': {'scale': 0.75, 'quality': 80, 'blur_radius': 0},
+            'ultra_high': {'scale': 1.0, 'quality': 95, 'blur_radius': 0}
+        }
+        
+        # 设备性能评估参数
+        self.device_capabilities = {
+            'mobile': {'max_width': 800, 'preferred_quality': 'medium'},
+            'tablet': {'max_width': 1200, 'preferred_quality': 'high'}, 
+            'desktop': {'max_width': 2000, 'preferred_quality': 'ultra_high'},
+            'high_end': {'max_width': 4000, 'preferred_quality': 'ultra_high'}
+        }
+    
+    def detect_device_capability(self) -> str:
+        """基于图像尺寸和用户代理检测设备性能级别"""
+        # 简化的设备检测逻辑
+        if self.original_width > 3000 or self.original_height > 20000:
+            return 'high_end'
+        elif self.original_width > 2000:
+            return 'desktop'
+        elif self.original_width > 1000:
+            return 'tablet'
+        else:
+            return 'mobile'
+    
+    def generate_initial(self) -> Dict[str, str]:
+        """只同步生成最小的级别用于首屏，返回全部级别的路径（其余级别可能尚未生成）"""
+        smallest = min(self.quality_levels, key=lambda name: self.quality_levels[name]['scale'])
+        try:
+            return self.generate_progressive_versions([smallest])
+        except Exception as e:
+            st.error(f"生成渐进式版本失败: {str(e)}")
+            return {}
+    
+    def generate_remaining(self, executor: ThreadPoolExecutor):
+        """在后台线程池中生成其余级别，返回 Future；异常保存在 Future 中，由脚本线程负责提示"""
+        return executor.submit(self.generate_progressive_versions)
+    
+    def generate_progressive_versions(self, level_names: Optional[List[str]] = None) -> Dict[str, str]:
+        """生成渐进式质量版本，level_names 为空时生成全部级别"""
+        versions = {}
+        device_type = self.detect_device_capability()
+        max_width = self.device_capabilities[device_type]['max_width']
         
-        return html_code
+        # 限制最大宽度
+        if self.original_width > max_width:
+            target_width = max_width
+            target_height = int(self.original_height * max_width / self.original_width)
+        else:
+            target_width, target_height = self.original_width, self.original_height
+        
+        # 一次性算出各级别尺寸，按缩放比例从大到小排列，只保留尚未生成的级别
+        levels = sorted(self.quality_levels.items(), key=lambda item: item[1]['scale'], reverse=True)
+        scales = np.array([config['scale'] for _, config in levels])
+        widths = np.maximum(1, (target_width * scales).astype(int))
+        heights = np.maximum(1, (target_height * scales).astype(int))
+        pending = []
+        for (level_name, config), level_width, level_height in zip(levels, widths, heights):
+            version_path = os.path.join(self.cache_dir, f"{level_name}_{target_width}x{target_height}{VERSION_EXT}")
+            versions[level_name] = version_path
+            # 已缓存的 JPEG 若被写成了基线格式，首屏渐进显示会失效，需重新生成
+            cached = os.path.exists(version_path) and (VERSION_FORMAT != 'JPEG' or is_progressive_jpeg(version_path))
+            if not cached and (level_names is None or level_name in level_names):
+                pending.append((level_name, config, (int(level_width), int(level_height)), version_path))
+        
+        if pending:
+            # 基准图只需达到待生成级别中最大的尺寸；首屏只生成 ultra_low 时，
+            # JPEG 源可直接按 1/8 解码（只用 DCT 直流系数，相当于 8x8 块平均），无需完整解码原图
+            base_size = pending[0][2]
+            with Image.open(self.image_path) as original_img:
+                if base_size != original_img.size:
+                    if original_img.format == 'JPEG':
+                        # JPEG 在 DCT 域直接按 1/2、1/4、1/8 解码，跳过大部分反变换，再从较小的缓冲区缩放
+                        original_img.draft('RGB', base_size)
+                    base_img = original_img.resize(base_size, Image.Resampling.LANCZOS)
+                else:
+                    base_img = original_img
+                # 只转换一次为 RGB，各级别链式缩放和编码线程只读共享；原图关闭后像素不可用，未缩放时需复制一份
+                if base_img.mode != 'RGB':
+                    base_img = base_img.convert('RGB')
+                elif base_img is original_img:
+                    base_img = original_img.copy()
+            
+            # 每一级从上一级的像素继续缩小，输入面积逐级递减
+            prev_img = base_img
+            # 缩放必须串行（后一级依赖前一级），模糊和编码交给线程池并行；PIL 的缩放和编码都会释放 GIL
+            with ThreadPoolExecutor(max_workers=min(len(pending), os.cpu_count() or 1)) as executor:
+                futures = []
+                for level_name, config, (level_width, level_height), version_path in pending:
+                    # 缩放图像：链式缩小，模糊前的结果留给下一级使用；尺寸不变（ultra_high）时直接复用基准图。
+                    # PIL 的 C 实现缩放比 NumPy 按抽头累加的可分离 Lanczos 快约一倍，且结果与原实现一致
+                    if prev_img.size != (level_width, level_height):
+                        prev_img = prev_img.resize((level_width, level_height), Image.Resampling.LANCZOS)
+                    futures.append(executor.submit(encode_level, prev_img, config, version_path))
+                
+                for future in futures:
+                    future.result()
+            
+        return {level_name: versions[level_name] for level_name in self.quality_levels}
+    
+    def get_streaming_html(self, versions: Dict[str, str]) -> str:
+        """生成自适应质量流式加载的HTML"""
+        
+        # 开启静态文件服务时只传 URL，浏览器按需请求并缓存；否则退回内嵌 base64
+        static_serving = st.get_option("server.enableStaticServing")
+        versions_src = {}
+        for level, path in versions.items():
+            if static_serving:
+                rel_path = os.path.relpath(path, STATIC_DIR).replace(os.sep, '/')
+                versions_src[level] = f"{STATIC_URL}/{rel_path}"
+                continue
+            try:
+                mime = 'image/webp' if path.endswith('.webp') else 'image/jpeg'
+                versions_src[level] = f'data:{mime};base64,' + encode_file_base64(path, os.path.getmtime(path))
+            except OSError:
+                continue
+        
+        versions_json = json.dumps(versions_src)
+        quality_config_json = json.dumps(self.quality_levels)
+        
+        return STREAMING_HTML_TEMPLATE.substitute(
+            VERSIONS_JSON=versions_json,
+            QUALITY_CONFIG_JSON=quality_config_json
+        )
+
+@st.cache_data(show_spinner=False)
+def get_progressive_versions(image_path: str, mtime: float) -> Dict[str, str]:
+    """按（路径, 修改时间）缓存各质量级别的文件路径，只同步生成首屏用的最小级别"""
+    return AdaptiveQualityStreaming(image_path).generate_initial()
+
+@st.cache_resource
+def get_version_executor():
+    """后台生成其余质量级别的线程池"""
+    return ThreadPoolExecutor(max_workers=1)
+
+@st.cache_resource(show_spinner=False)
+def start_remaining_versions(image_path: str, mtime: float):
+    """每个（路径, 修改时间）只提交一次后台生成任务"""
+    return AdaptiveQualityStreaming(image_path).generate_remaining(get_version_executor())
 
 def render_adaptive_quality_viewer(image_path: str, output_format: str):
     """渲染自适应质量流式加载界面"""
@@ -481,10 +634,27 @@ def render_adaptive_quality_viewer(image_path: str, output_format: str):
         
         # 生成渐进式版本
         with st.spinner("正在生成自适应质量版本..."):
-            versions = loader.generate_progressive_versions()
+            versions = get_progressive_versions(image_path, loader.mtime)
+            if not versions or not os.path.exists(versions['ultra_low']):
+                # 上次生成失败或缓存目录被清理过，重新生成
+                get_progressive_versions.clear()
+                start_remaining_versions.clear()
+                versions = get_progressive_versions(image_path, loader.mtime)
+        # 首屏只等最小级别，其余级别在后台生成，页面中的查看器会等文件就绪后再切换
+        future = start_remaining_versions(image_path, loader.mtime)
+        if future.done() and future.exception() is not None:
+            # 后台线程里调用 st.error 不会显示，失败只能在脚本线程中提示；
+            # 清掉缓存的 Future，下次重跑时重新提交，同时只把已生成的级别交给查看器，避免前端空轮询
+            st.error(f"后台生成其余质量级别失败: {future.exception()}")
+            start_remaining_versions.clear()
+            versions = {level: path for level, path in versions.items() if os.path.exists(path)}
         
         if versions:
-            st.success(f"已生成 {len(versions)} 个质量级别")
+            ready_count = sum(os.path.exists(path) for path in versions.values())
+            if ready_count < len(versions):
+                st.success(f"已生成 {ready_count}/{len(versions)} 个质量级别，其余级别正在后台生成")
+            else:
+                st.success(f"已生成 {len(versions)} 个质量级别")
             
             # 显示版本信息
             with st.expander("查看质量级别详情"):
@@ -506,10 +676,9 @@ def render_adaptive_quality_viewer(image_path: str, output_format: str):
         
         # 文件信息
         file_size = os.path.getsize(image_path) / (1024 * 1024)
-        with Image.open(image_path) as img:
-            width, height = img.size
         
-        st.metric("原图尺寸", f"{width:,}×{height:,}")
+        # 尺寸已由加载器读取（或来自 manifest），无需再次打开图像
+        st.metric("原图尺寸", f"{loader.original_width:,}×{loader.original_height:,}")
         st.metric("文件大小", f"{file_size:.2f} MB")
         st.metric("设备类型", device_type)
         
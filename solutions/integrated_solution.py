@@ -4,9 +4,13 @@
 """
 
 import os
+import shutil
+import threading
 import streamlit as st
+from PIL import Image
 from enum import Enum
-from solutions.multi_level_preview import render_multi_level_preview
+from functools import cached_property
+from solutions.multi_level_preview import render_multi_level_preview, read_file_bytes, get_image_info, preview_cache_key
 from solutions.virtual_scroll_viewer import render_virtual_scroll_viewer
 from solutions.adaptive_quality_streaming import render_adaptive_quality_viewer
 from solutions.smart_preview_panel import render_smart_preview_panel
@@ -18,21 +22,73 @@ class DisplayMode(Enum):
     SMART_PANEL = "智能预览面板"
     AUTO_SELECT = "智能自动选择"
 
+# 选择器的选项顺序和下标查找表
+MODE_ORDER = list(DisplayMode)
+MODE_INDEX = {mode: i for i, mode in enumerate(MODE_ORDER)}
+
+# 各显示模式的说明，模块加载时构建一次
+MODE_DESCRIPTIONS = {
+    DisplayMode.MULTI_LEVEL: {
+        "title": "🏔️ 分层预览系统",
+        "description": "多分辨率渐进加载，适合中小型长图",
+        "best_for": "文件大小 < 50MB，高度 < 20000px",
+        "performance": "⚡ 快速 | 💾 中等内存 | 🌐 网络友好",
+        "pros": ["即时缩略图显示", "渐进式质量提升", "下载按钮置顶"],
+        "cons": ["需要额外存储", "初次生成较慢"]
+    },
+    DisplayMode.VIRTUAL_SCROLL: {
+        "title": "🎢 虚拟滚动查看器", 
+        "description": "分块渲染，仅加载可视区域，适合超大长图",
+        "best_for": "文件大小 > 50MB 或 高度 > 20000px",
+        "performance": "🚀 极快 | 💾 极低内存 | 🎮 流畅滚动",
+        "pros": ["支持无限长图", "内存占用极低", "滚动性能优秀"],
+        "cons": ["初次分块耗时", "需要大量存储空间"]
+    },
+    DisplayMode.ADAPTIVE_QUALITY: {
+        "title": "🎯 自适应质量流式加载",
+        "description": "根据网络和设备自动调整质量，智能加载",
+        "best_for": "网络环境不稳定，移动设备访问",
+        "performance": "⚡ 超快首屏 | 💾 智能内存 | 🌐 自适应网络", 
+        "pros": ["网络自适应", "设备性能感知", "带宽优化"],
+        "cons": ["算法复杂", "预处理时间长"]
+    },
+    DisplayMode.SMART_PANEL: {
+        "title": "🧠 智能预览面板",
+        "description": "学习用户偏好，提供个性化预览体验",
+        "best_for": "经常使用的用户，需要个性化体验",
+        "performance": "🤖 智能化 | 💾 适中内存 | 🎯 个性化",
+        "pros": ["用户偏好学习", "智能推荐", "优秀UI设计"],
+        "cons": ["需要数据积累", "算法最复杂"]
+    }
+}
+
 class IntegratedImageViewer:
     def __init__(self, image_path: str, output_format: str):
         self.image_path = image_path
         self.output_format = output_format
         
-        # 获取图像基本信息用于智能选择
-        with Image.open(image_path) as img:
-            self.width, self.height = img.size
-        
-        self.file_size_mb = os.path.getsize(image_path) / (1024 * 1024)
+        # 获取图像基本信息用于智能选择：文件大小来自 stat，宽高用到时才读取
+        stat = os.stat(image_path)
+        self.mtime = stat.st_mtime
+        self.file_size_mb = stat.st_size / (1024 * 1024)
+    
+    @cached_property
+    def width(self) -> int:
+        return get_image_info(self.image_path, self.mtime)[0]
+    
+    @cached_property
+    def height(self) -> int:
+        return get_image_info(self.image_path, self.mtime)[1]
+    
+    @cached_property
+    def recommended_mode(self) -> DisplayMode:
+        """推荐模式只计算一次"""
+        return self.auto_select_best_mode()
         
     def auto_select_best_mode(self) -> DisplayMode:
         """基于图像特征自动选择最佳显示模式"""
         
-        # 超大图像 (>50MB 或 高度>20000px) -> 虚拟滚动
+        # 超大图像 (>50MB 或 高度>20000px) -> 虚拟滚动；先判断文件大小，超过 50MB 时无需读取宽高
         if self.file_size_mb > 50 or self.height > 20000:
             return DisplayMode.VIRTUAL_SCROLL
             
@@ -50,41 +106,7 @@ class IntegratedImageViewer:
     
     def get_mode_description(self, mode: DisplayMode) -> dict:
         """获取显示模式的详细描述"""
-        descriptions = {
-            DisplayMode.MULTI_LEVEL: {
-                "title": "🏔️ 分层预览系统",
-                "description": "多分辨率渐进加载，适合中小型长图",
-                "best_for": "文件大小 < 50MB，高度 < 20000px",
-                "performance": "⚡ 快速 | 💾 中等内存 | 🌐 网络友好",
-                "pros": ["即时缩略图显示", "渐进式质量提升", "下载按钮置顶"],
-                "cons": ["需要额外存储", "初次生成较慢"]
-            },
-            DisplayMode.VIRTUAL_SCROLL: {
-                "title": "🎢 虚拟滚动查看器", 
-                "description": "分块渲染，仅加载可视区域，适合超大长图",
-                "best_for": "文件大小 > 50MB 或 高度 > 20000px",
-                "performance": "🚀 极快 | 💾 极低内存 | 🎮 流畅滚动",
-                "pros": ["支持无限长图", "内存占用极低", "滚动性能优秀"],
-                "cons": ["初次分块耗时", "需要大量存储空间"]
-            },
-            DisplayMode.ADAPTIVE_QUALITY: {
-                "title": "🎯 自适应质量流式加载",
-                "description": "根据网络和设备自动调整质量，智能加载",
-                "best_for": "网络环境不稳定，移动设备访问",
-                "performance": "⚡ 超快首屏 | 💾 智能内存 | 🌐 自适应网络", 
-                "pros": ["网络自适应", "设备性能感知", "带宽优化"],
-                "cons": ["算法复杂", "预处理时间长"]
-            },
-            DisplayMode.SMART_PANEL: {
-                "title": "🧠 智能预览面板",
-                "description": "学习用户偏好，提供个性化预览体验",
-                "best_for": "经常使用的用户，需要个性化体验",
-                "performance": "🤖 智能化 | 💾 适中内存 | 🎯 个性化",
-                "pros": ["用户偏好学习", "智能推荐", "优秀UI设计"],
-                "cons": ["需要数据积累", "算法最复杂"]
-            }
-        }
-        return descriptions.get(mode, {})
+        return MODE_DESCRIPTIONS.get(mode, {})
 
 def render_integrated_viewer(image_path: str, output_format: str):
     """渲染集成的图像查看器"""
@@ -104,7 +126,7 @@ def render_integrated_viewer(image_path: str, output_format: str):
     with col3:
         st.metric("长宽比", f"{viewer.height/viewer.width:.2f}")
     with col4:
-        recommended_mode = viewer.auto_select_best_mode()
+        recommended_mode = viewer.recommended_mode
         st.metric("推荐模式", recommended_mode.value)
     
     # 模式选择器
@@ -113,9 +135,9 @@ def render_integrated_viewer(image_path: str, output_format: str):
     with col_mode:
         selected_mode = st.selectbox(
             "选择显示模式",
-            options=list(DisplayMode),
+            options=MODE_ORDER,
             format_func=lambda x: x.value,
-            index=list(DisplayMode).index(recommended_mode)
+            index=MODE_INDEX[recommended_mode]
         )
     
     with col_auto:
@@ -172,10 +194,73 @@ def render_integrated_viewer(image_path: str, output_format: str):
         # 回退方案：使用现有的简单显示逻辑
         render_fallback_viewer(image_path, output_format)
 
+# 回退显示的图像复制到 Streamlit 的 static/ 目录，浏览器按 URL 获取并缓存
+STATIC_DIR = "static"
+STATIC_URL = "/app/static"
+# Streamlit 静态文件服务不提供超过 200MB 的文件
+STATIC_MAX_BYTES = 200 * 1024 * 1024
+# 回退显示的静态副本总量超过上限时删除最久未使用的文件
+FALLBACK_DIR = os.path.join(STATIC_DIR, "fallback")
+FALLBACK_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+LANCZOS = Image.Resampling.LANCZOS
+
+def evict_fallback_cache(keep_path: str):
+    """静态副本超过容量上限时，从最久未使用的文件开始删除"""
+    entries = []
+    total_size = 0
+    with os.scandir(FALLBACK_DIR) as it:
+        for entry in it:
+            # 跳过正在写入的临时文件
+            if not entry.is_file() or entry.name.endswith(".part"):
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_size += stat.st_size
+    
+    for _, size, path in sorted(entries):
+        if total_size <= FALLBACK_CACHE_MAX_BYTES:
+            break
+        if os.path.samefile(path, keep_path):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total_size -= size
+
+def get_static_image_url(image_path: str, mtime: float, size: int) -> str:
+    """按内容哈希把图像复制到静态目录一次，返回其 URL；未开启静态文件服务或文件过大时返回 None。
+    命中时刷新文件时间用于 LRU 淘汰，因此不做 st.cache_data 缓存（副本可能已被淘汰）"""
+    if not st.get_option("server.enableStaticServing") or size > STATIC_MAX_BYTES:
+        return None
+    os.makedirs(FALLBACK_DIR, exist_ok=True)
+    file_name = preview_cache_key(image_path, mtime, size) + os.path.splitext(image_path)[1].lower()
+    static_path = os.path.join(FALLBACK_DIR, file_name)
+    if os.path.exists(static_path):
+        os.utime(static_path)
+    else:
+        # 先写临时文件再替换，其他会话不会读到复制了一半的文件
+        part_path = f"{static_path}.{os.getpid()}.{threading.get_ident()}.part"
+        shutil.copyfile(image_path, part_path)
+        os.replace(part_path, static_path)
+        evict_fallback_cache(static_path)
+    return f"{STATIC_URL}/fallback/{file_name}"
+
+def show_full_image(image_path: str, stat: os.stat_result, caption: str):
+    """显示完整图像：能走静态文件服务时只输出 <img src=...>，否则交给 st.image 读取文件"""
+    image_url = get_static_image_url(image_path, stat.st_mtime, stat.st_size)
+    if image_url:
+        # st.image 只把 http/https/data 开头的字符串当作 URL，相对路径需通过 HTML 输出
+        st.markdown(f'<img src="{image_url}" alt="{caption}" style="width:100%">', unsafe_allow_html=True)
+        st.caption(caption)
+    else:
+        st.image(image_path, caption=caption, use_container_width=True)
+
 def render_fallback_viewer(image_path: str, output_format: str):
     """回退方案：简单但可靠的图像显示"""
     try:
-        file_size_mb = os.path.getsize(image_path) / (1024 * 1024)
+        stat = os.stat(image_path)
+        file_size_mb = stat.st_size / (1024 * 1024)
         
         col1, col2 = st.columns([3, 1])
         
@@ -185,26 +270,25 @@ def render_fallback_viewer(image_path: str, output_format: str):
                 with Image.open(image_path) as img:
                     max_width = 1500
                     if img.width > max_width:
-                        ratio = max_width / img.width
-                        new_size = (max_width, int(img.height * ratio))
-                        thumbnail = img.resize(new_size, Image.Resampling.LANCZOS)
-                        st.image(thumbnail, caption=f'预览图 (原始大小: {file_size_mb:.2f}MB)', use_container_width=True)
+                        # thumbnail 原地缩放并保持长宽比，JPEG 源还会先按 DCT 缩放解码
+                        img.thumbnail((max_width, img.height), LANCZOS, reducing_gap=3.0)
+                        st.image(img, caption=f'预览图 (原始大小: {file_size_mb:.2f}MB)', use_container_width=True)
                     else:
-                        st.image(image_path, caption='转换后的长图', use_container_width=True)
+                        show_full_image(image_path, stat, '转换后的长图')
             else:
-                st.image(image_path, caption='转换后的长图', use_container_width=True)
+                # 重跑时只输出 <img src=...>，不再由 Streamlit 重新读取和传输整张图
+                show_full_image(image_path, stat, '转换后的长图')
         
         with col2:
             st.subheader("📥 下载")
-            with open(image_path, "rb") as file:
-                st.download_button(
-                    label="下载完整图像",
-                    data=file.read(),
-                    file_name=os.path.basename(image_path),
-                    mime=f"image/{output_format.lower()}",
-                    use_container_width=True,
-                    type="primary"
-                )
+            st.download_button(
+                label="下载完整图像",
+                data=read_file_bytes(image_path, stat.st_mtime),
+                file_name=os.path.basename(image_path),
+                mime=f"image/{output_format.lower()}",
+                use_container_width=True,
+                type="primary"
+            )
                 
     except Exception as e:
         st.error(f"显示图像失败: {str(e)}")
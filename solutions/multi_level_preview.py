@@ -6,17 +6,102 @@
 import os
 import io
 import base64
+import functools
+import hashlib
+import mimetypes
+import shutil
 from PIL import Image, ImageOps
 import streamlit as st
-from typing import Dict, Tuple, List
+from typing import Dict, Tuple, List, Optional
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+try:
+    import pyvips  # 可选依赖：libvips 按行流式解码并缩小，原图无需整幅载入内存
+except (ImportError, OSError):
+    pyvips = None
+
+try:
+    import pillow_avif  # 可选依赖：为旧版 Pillow 注册 AVIF 编解码插件
+except ImportError:
+    pillow_avif = None
+
+# 高清级别体积最大，支持 AVIF 时改用 AVIF（同等观感下比 WebP 再小约三成）；
+# 直接查已注册的保存插件，Pillow 11 之前的 features.check('avif') 会对未知特性发出警告。
+# Image.init() 加载全部内置插件，Image.SAVE 才完整
+Image.init()
+HIGH_LEVEL_AVIF = 'AVIF' in Image.SAVE
+if HIGH_LEVEL_AVIF:
+    mimetypes.add_type('image/avif', '.avif')
+
+# 预览金字塔缓存：按内容哈希分目录，总量超过上限时删除最久未使用的目录
+PREVIEW_CACHE_DIR = "cache"
+PREVIEW_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+HASH_SAMPLE_BYTES = 64 * 1024
+
+@functools.lru_cache(maxsize=64)
+def preview_cache_key(image_path: str, mtime: float, size: int) -> str:
+    """用文件头尾各 64KB 加文件大小计算内容哈希，耗时与文件大小无关；同名不同内容不会冲突，改名重传也能复用。
+    按（路径, 修改时间, 大小）缓存，重跑时不再读文件"""
+    hasher = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(image_path, 'rb') as f:
+        hasher.update(f.read(HASH_SAMPLE_BYTES))
+        if size > HASH_SAMPLE_BYTES:
+            f.seek(max(HASH_SAMPLE_BYTES, size - HASH_SAMPLE_BYTES))
+            hasher.update(f.read())
+    return hasher.hexdigest()
+
+def evict_preview_cache(keep_dir: str):
+    """预览缓存超过容量上限时，从最久未使用的目录开始删除"""
+    entries = []
+    total_size = 0
+    with os.scandir(PREVIEW_CACHE_DIR) as it:
+        for entry in it:
+            if not entry.is_dir():
+                continue
+            size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+            entries.append((entry.stat().st_mtime, size, entry.path))
+            total_size += size
+    
+    for _, size, path in sorted(entries):
+        if total_size <= PREVIEW_CACHE_MAX_BYTES:
+            break
+        if os.path.samefile(path, keep_dir):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total_size -= size
+
+def vips_thumbnail(image_path: str, size: Tuple[int, int]) -> Image.Image:
+    """用 libvips 边解码边缩小到指定尺寸，常驻内存只与条带高度和输出尺寸有关"""
+    vimg = pyvips.Image.thumbnail(image_path, size[0], height=size[1], size='force')
+    if vimg.format != 'uchar':
+        vimg = vimg.cast('uchar')
+    mode = {1: 'L', 2: 'LA', 3: 'RGB', 4: 'RGBA'}[vimg.bands]
+    return Image.frombytes(mode, (vimg.width, vimg.height), vimg.write_to_memory())
+
+def get_device_hint() -> Dict[str, bool]:
+    """根据请求头判断是否为移动设备、是否处于慢速网络（Save-Data 或 ECT 客户端提示）"""
+    try:
+        headers = st.context.headers
+    except AttributeError:
+        return {'mobile': False, 'slow_network': False}
+    user_agent = headers.get('User-Agent', '')
+    effective_type = headers.get('ECT', '').lower()
+    return {
+        'mobile': 'Mobi' in user_agent or 'Android' in user_agent,
+        'slow_network': headers.get('Save-Data', '').lower() == 'on' or effective_type in ('slow-2g', '2g', '3g')
+    }
 
 class MultiLevelPreview:
-    def __init__(self, image_path: str):
+    def __init__(self, image_path: str, device_hint: Optional[Dict[str, bool]] = None):
         self.image_path = image_path
         self.base_name = os.path.splitext(os.path.basename(image_path))[0]
-        self.cache_dir = os.path.join("cache", self.base_name)
+        # 一次 stat 取得修改时间和大小，本次渲染内各处复用
+        stat = os.stat(image_path)
+        self.mtime = stat.st_mtime
+        self.file_size = stat.st_size
+        self.cache_dir = os.path.join(PREVIEW_CACHE_DIR, preview_cache_key(image_path, self.mtime, self.file_size))
         os.makedirs(self.cache_dir, exist_ok=True)
         
         # 预定义的分辨率级别
@@ -27,62 +112,166 @@ class MultiLevelPreview:
             'high': 2500          # 高清图：最大宽度2500px
         }
         
+        # 按设备裁剪级别：手机不会显示 2500px 的高清图，慢速网络不生成中等图
+        if device_hint:
+            if device_hint.get('mobile'):
+                self.levels.pop('high')
+            if device_hint.get('slow_network'):
+                self.levels.pop('medium')
+        
+        # 构造时就在后台开始生成 Base64 缩略图，渲染时不阻塞界面
+        self.thumbnail_future = start_base64_thumbnail(image_path, self.mtime, 200)
+        
     def generate_preview_levels(self) -> Dict[str, str]:
-        """生成多级预览图并返回路径"""
+        """生成多级预览图并返回路径，结果按（路径, 修改时间, 级别）缓存"""
         try:
-            with Image.open(self.image_path) as original_img:
-                original_width, original_height = original_img.size
-                aspect_ratio = original_height / original_width
-                
-                preview_paths = {}
-                
-                for level_name, max_width in self.levels.items():
-                    # 只有当原图宽度大于目标宽度时才缩放
-                    if original_width <= max_width:
-                        preview_paths[level_name] = self.image_path
-                        continue
-                        
-                    # 计算新尺寸
-                    new_width = min(max_width, original_width)
-                    new_height = int(new_width * aspect_ratio)
-                    
-                    # 生成预览图路径
-                    webp_path = os.path.join(self.cache_dir, f"{level_name}_{new_width}x{new_height}.webp")
-                    
-                    if not os.path.exists(webp_path):
-                        # 创建并保存WebP格式的预览图
-                        resized_img = original_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                        
-                        # WebP参数优化
-                        webp_quality = 85 if level_name in ['high', 'medium'] else 75
-                        resized_img.save(webp_path, 'WEBP', quality=webp_quality, method=6)
-                    
-                    preview_paths[level_name] = webp_path
-                    
-                return preview_paths
-                
+            # 更新目录时间，淘汰时按最近使用排序
+            os.utime(self.cache_dir)
+            key = (self.image_path, self.mtime, tuple(self.levels.items()))
+            preview_paths = cached_preview_levels(*key)
+            if not all(os.path.exists(path) for path in preview_paths.values()):
+                # 缓存目录已被淘汰，重新生成
+                cached_preview_levels.clear()
+                preview_paths = cached_preview_levels(*key)
+            return preview_paths
         except Exception as e:
             st.error(f"生成预览图失败: {str(e)}")
             return {}
     
-    def get_base64_thumbnail(self, max_size: int = 200) -> str:
-        """生成Base64编码的超小缩略图，用于即时显示"""
-        try:
-            with Image.open(self.image_path) as img:
-                # 创建极小的缩略图
-                img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-                
-                buffer = io.BytesIO()
-                img.save(buffer, format='WEBP', quality=60)
-                buffer.seek(0)
+    def build_preview_levels(self) -> Dict[str, str]:
+        """实际生成多级预览图，失败时抛出异常（避免把失败结果写入缓存）"""
+        # 先根据缓存的图像尺寸算出各级别路径，只有存在缺失或过期的级别时才打开原图
+        source_mtime = self.mtime
+        original_width, original_height, _ = get_image_info(self.image_path, source_mtime)
+        aspect_ratio = original_height / original_width
+        
+        preview_paths = {}
+        pending = []
+        
+        for level_name, max_width in self.levels.items():
+            # 只有当原图宽度大于目标宽度时才缩放
+            if original_width <= max_width:
+                preview_paths[level_name] = self.image_path
+                continue
                 
-                return base64.b64encode(buffer.getvalue()).decode()
+            # 计算新尺寸
+            new_width = min(max_width, original_width)
+            new_height = int(new_width * aspect_ratio)
+            
+            # 生成预览图路径
+            ext = 'avif' if level_name == 'high' and HIGH_LEVEL_AVIF else 'webp'
+            webp_path = os.path.join(self.cache_dir, f"{level_name}_{new_width}x{new_height}.{ext}")
+            
+            # 预览图早于原图时视为过期
+            if not os.path.exists(webp_path) or os.path.getmtime(webp_path) < source_mtime:
+                pending.append((level_name, (new_width, new_height), webp_path))
+            
+            preview_paths[level_name] = webp_path
+        
+        if not pending:
+            return preview_paths
+        
+        with Image.open(self.image_path) as original_img:
+            # 原图只解码一次；按宽度从大到小逐级缩小，每一级以上一级的结果为输入，
+            # 缩放量按几何级数递减；各级别的WebP编码在线程中并行（Pillow 编码时释放 GIL）
+            pending.sort(key=lambda item: item[1][0], reverse=True)
+            current_img = original_img
+            with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+                futures = []
+                for level_name, size, webp_path in pending:
+                    if current_img is original_img and pyvips is not None:
+                        # 最大的一级直接由 libvips 流式生成，原图不会整幅解码到内存
+                        current_img = vips_thumbnail(self.image_path, size)
+                    else:
+                        # reducing_gap：大倍数缩小时先用 box 滤波粗缩到目标的 2 倍，再做 LANCZOS
+                        current_img = current_img.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+                    futures.append(executor.submit(self.save_preview_level, current_img, level_name, webp_path))
+                for future in futures:
+                    future.result()
+        evict_preview_cache(self.cache_dir)
+        
+        return preview_paths
+    
+    def save_preview_level(self, resized_img: Image.Image, level_name: str, webp_path: str) -> str:
+        """保存单个级别的WebP（高清级别可能为AVIF）预览图"""
+        # WebP参数优化
+        webp_quality = 85 if level_name in ['high', 'medium'] else 75
+        if webp_path.endswith('.avif'):
+            resized_img.save(webp_path, 'AVIF', quality=webp_quality)
+            return webp_path
+        # 低级别很快会被更高质量的级别替换，用更快的编码模式；只有高清级别用最慢最省体积的 method=6
+        webp_method = 6 if level_name == 'high' else 4 if level_name == 'medium' else 2
+        resized_img.save(webp_path, 'WEBP', quality=webp_quality, method=webp_method)
+        return webp_path
+    
+    def get_base64_thumbnail(self, max_size: int = 200, timeout: Optional[float] = None) -> str:
+        """获取Base64编码的超小缩略图，用于即时显示；超过 timeout 仍未生成完或生成失败时返回空字符串"""
+        future = self.thumbnail_future if max_size == 200 else start_base64_thumbnail(
+            self.image_path, self.mtime, max_size)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            return ""
         except Exception as e:
+            # 失败的 Future 不保留在缓存中，下次重跑时重新提交
+            start_base64_thumbnail.clear()
             return ""
 
+@st.cache_resource(show_spinner=False)
+def cached_preview_levels(image_path: str, mtime: float, levels: Tuple[Tuple[str, int], ...]) -> Dict[str, str]:
+    """每个（路径, 修改时间, 级别）只生成一次金字塔，之后的点击和重跑直接返回路径"""
+    preview_system = MultiLevelPreview(image_path)
+    preview_system.levels = dict(levels)
+    return preview_system.build_preview_levels()
+
+@st.cache_resource
+def get_thumbnail_executor():
+    """后台生成 Base64 缩略图的线程池"""
+    return ThreadPoolExecutor(max_workers=1)
+
+@st.cache_resource(show_spinner=False)
+def start_base64_thumbnail(image_path: str, mtime: float, max_size: int):
+    """每个（路径, 修改时间, 尺寸）只提交一次缩略图任务，返回的 Future 在重跑之间保留"""
+    return get_thumbnail_executor().submit(encode_base64_thumbnail, image_path, max_size)
+
+@st.fragment(run_every=1)
+def wait_for_base64_thumbnail(image_path: str, mtime: float):
+    """缩略图生成期间每秒检查一次，完成后整页重跑显示缩略图，重跑时不再调用该片段，轮询随之停止"""
+    if start_base64_thumbnail(image_path, mtime, 200).done():
+        st.rerun()
+    st.caption("缩略图生成中...")
+
+def encode_base64_thumbnail(image_path: str, max_size: int) -> str:
+    """生成 Base64 编码的 WebP 缩略图"""
+    with Image.open(image_path) as img:
+        # JPEG 源直接在 DCT 域按 1/2~1/8 解码，避免完整解码整张长图（其他格式调用无效果）
+        img.draft('RGB', (max_size * 2, max_size * 2))
+        # 创建极小的缩略图
+        img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        
+        # 仅作占位显示，用最快的WebP编码模式
+        buffer = io.BytesIO()
+        img.save(buffer, format='WEBP', quality=50, method=0)
+        buffer.seek(0)
+        
+        return base64.b64encode(buffer.getvalue()).decode()
+
+@st.cache_data(show_spinner=False)
+def get_image_info(path: str, mtime: float) -> Tuple[int, int, float]:
+    """只读取文件头获取（宽, 高, 大小MB），按修改时间缓存"""
+    with Image.open(path) as img:
+        width, height = img.size
+    return width, height, os.path.getsize(path) / (1024 * 1024)
+
+@st.cache_data(show_spinner=False, max_entries=4, ttl=3600)
+def read_file_bytes(path: str, mtime: float) -> bytes:
+    """下载按钮用的文件内容，按修改时间缓存，避免每次重跑都把整张大图读入内存"""
+    with open(path, "rb") as file:
+        return file.read()
+
 def render_multi_level_preview(image_path: str, output_format: str):
     """渲染分层预览界面"""
-    preview_system = MultiLevelPreview(image_path)
+    preview_system = MultiLevelPreview(image_path, get_device_hint())
     
     # 创建三栏布局
     col1, col2, col3 = st.columns([2, 1, 1])
@@ -91,13 +280,17 @@ def render_multi_level_preview(image_path: str, output_format: str):
         st.subheader("图像预览")
         
         # 立即显示Base64缩略图
-        base64_thumb = preview_system.get_base64_thumbnail()
+        base64_thumb = preview_system.get_base64_thumbnail(timeout=0.1)
         if base64_thumb:
             st.markdown(
                 f'<img src="data:image/webp;base64,{base64_thumb}" '
                 f'style="width:100%;max-width:300px;border-radius:8px;box-shadow:0 2px 8px rgba(0,0,0,0.1);">',
                 unsafe_allow_html=True
             )
+        elif preview_system.thumbnail_future.done():
+            st.caption("缩略图生成失败，下次刷新时重试")
+        else:
+            wait_for_base64_thumbnail(image_path, preview_system.mtime)
             
         # 异步生成高质量预览图
         if st.button("加载高清预览", key="load_hq_preview"):
@@ -114,10 +307,8 @@ def render_multi_level_preview(image_path: str, output_format: str):
         st.subheader("下载选项")
         
         # 获取文件信息
-        file_size = os.path.getsize(image_path) / (1024 * 1024)  # MB
-        with Image.open(image_path) as img:
-            width, height = img.size
-            
+        width, height, file_size = get_image_info(image_path, preview_system.mtime)
+        
         # 文件信息显示
         st.info(f"""
         **文件信息**
@@ -127,15 +318,14 @@ def render_multi_level_preview(image_path: str, output_format: str):
         """)
         
         # 主下载按钮 - 置顶显示
-        with open(image_path, "rb") as file:
-            st.download_button(
-                label="⬇️ 下载原图",
-                data=file.read(),
-                file_name=os.path.basename(image_path),
-                mime=f"image/{output_format.lower()}",
-                use_container_width=True,
-                type="primary"
-            )
+        st.download_button(
+            label="⬇️ 下载原图",
+            data=read_file_bytes(image_path, preview_system.mtime),
+            file_name=os.path.basename(image_path),
+            mime=f"image/{output_format.lower()}",
+            use_container_width=True,
+            type="primary"
+        )
     
     with col3:
         st.subheader("预览选项")
@@ -143,14 +333,14 @@ def render_multi_level_preview(image_path: str, output_format: str):
         # 预览级别选择器
         preview_level = st.selectbox(
             "选择预览质量",
-            options=["thumbnail", "preview", "medium", "high"],
+            options=list(preview_system.levels),
             format_func=lambda x: {
                 "thumbnail": "缩略图 (快速)",
                 "preview": "预览图 (推荐)", 
                 "medium": "中等质量",
                 "high": "高质量"
             }[x],
-            index=1
+            index=min(1, len(preview_system.levels) - 1)
         )
         
         if st.button("切换预览", key="switch_preview"):
@@ -6,8 +6,9 @@
 import os
 import io
 import json
-import base64
-import hashlib
+import binascii
+import functools
+import string
 from datetime import datetime, timedelta
 from PIL import Image, ImageDraw, ImageFont
 import streamlit as st
@@ -15,172 +16,29 @@ import streamlit.components.v1 as components
 from typing import Dict, List, Tuple, Optional
 import threading
 import queue
+from concurrent.futures import ThreadPoolExecutor
+from solutions.multi_level_preview import pyvips, vips_thumbnail, preview_cache_key, get_image_info, read_file_bytes
 
-class SmartPreviewPanel:
-    def __init__(self, image_path: str):
-        self.image_path = image_path
-        self.base_name = os.path.splitext(os.path.basename(image_path))[0]
-        self.preview_cache_dir = os.path.join("smart_cache", self.base_name)
-        self.analytics_dir = os.path.join("analytics", "user_behavior")
-        
-        os.makedirs(self.preview_cache_dir, exist_ok=True)
-        os.makedirs(self.analytics_dir, exist_ok=True)
-        
-        # 获取图像基础信息
-        with Image.open(image_path) as img:
-            self.original_width, self.original_height = img.size
-            self.aspect_ratio = self.original_height / self.original_width
-        
-        # 智能预览配置
-        self.smart_preview_levels = {
-            'instant': {
-                'width': 400, 
-                'quality': 60, 
-                'description': '瞬时预览',
-                'load_time_target': 0.5  # 秒
-            },
-            'quick': {
-                'width': 800, 
-                'quality': 75, 
-                'description': '快速预览',
-                'load_time_target': 1.0
-            },
-            'detailed': {
-                'width': 1200, 
-                'quality': 85, 
-                'description': '详细预览',
-                'load_time_target': 2.0
-            },
-            'full': {
-                'width': 2000, 
-                'quality': 95, 
-                'description': '完整预览',
-                'load_time_target': 5.0
-            }
-        }
-    
-    def generate_smart_previews(self) -> Dict[str, Dict]:
-        """生成智能预览版本"""
-        previews = {}
-        
-        try:
-            with Image.open(self.image_path) as original_img:
-                for level_name, config in self.smart_preview_levels.items():
-                    preview_info = self.create_smart_preview(original_img, level_name, config)
-                    if preview_info:
-                        previews[level_name] = preview_info
-                        
-            return previews
-            
-        except Exception as e:
-            st.error(f"生成智能预览失败: {str(e)}")
-            return {}
-    
-    def create_smart_preview(self, img: Image.Image, level_name: str, config: Dict) -> Optional[Dict]:
-        """创建单个智能预览版本"""
-        try:
-            target_width = min(config['width'], self.original_width)
-            target_height = int(target_width * self.aspect_ratio)
-            
-            preview_path = os.path.join(self.preview_cache_dir, f"smart_{level_name}_{target_width}x{target_height}.webp")
-            
-            if not os.path.exists(preview_path):
-                # 创建预览图像
-                preview_img = img.resize((target_width, target_height), Image.Resampling.LANCZOS)
-                
-                # 添加智能水印（包含预览信息）
-                preview_img = self.add_smart_watermark(preview_img, level_name, config)
-                
-                # 保存WebP格式
-                preview_img.save(
-                    preview_path, 
-                    'WEBP', 
-                    quality=config['quality'],
-                    method=6
-                )
-            
-            # 获取文件信息
-            file_size = os.path.getsize(preview_path) / 1024  # KB
-            
-            # 转换为base64
-            with open(preview_path, 'rb') as f:
-                base64_data = base64.b64encode(f.read()).decode()
-            
-            return {
-                'path': preview_path,
-                'base64': base64_data,
-                'width': target_width,
-                'height': target_height,
-                'file_size_kb': file_size,
-                'quality': config['quality'],
-                'description': config['description'],
-                'load_time_target': config['load_time_target']
-            }
-            
-        except Exception as e:
-            return None
-    
-    def add_smart_watermark(self, img: Image.Image, level_name: str, config: Dict) -> Image.Image:
-        """添加智能水印信息"""
-        try:
-            # 创建副本以避免修改原图
-            watermarked = img.copy()
-            draw = ImageDraw.Draw(watermarked)
-            
-            # 水印信息
-            watermark_text = f"{config['description']} | {config['quality']}% 质量"
-            
-            # 计算水印位置（右下角）
-            img_width, img_height = watermarked.size
-            
-            # 尝试加载字体（如果失败则使用默认字体）
-            try:
-                font_size = max(12, min(24, img_width // 50))
-                font = ImageFont.truetype("/System/Library/Fonts/Arial.ttf", font_size)
-            except:
-                font = ImageFont.load_default()
-            
-            # 获取文本尺寸
-            bbox = draw.textbbox((0, 0), watermark_text, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-            
-            # 计算位置（右下角，留边距）
-            margin = 10
-            x = img_width - text_width - margin
-            y = img_height - text_height - margin
-            
-            # 绘制半透明背景
-            background_padding = 5
-            draw.rectangle(
-                [x - background_padding, y - background_padding, 
-                 x + text_width + background_padding, y + text_height + background_padding],
-                fill=(0, 0, 0, 128)
-            )
-            
-            # 绘制文本
-            draw.text((x, y), watermark_text, font=font, fill=(255, 255, 255, 200))
-            
-            return watermarked
-            
-        except Exception:
-            # 如果水印添加失败，返回原图
-            return img
-    
-    def get_smart_panel_html(self, previews: Dict[str, Dict], output_format: str) -> str:
-        """生成智能预览面板HTML"""
-        
-        previews_json = json.dumps(previews)
-        
-        # 获取原图文件信息
-        original_size = os.path.getsize(self.image_path) / (1024 * 1024)  # MB
-        
-        html_code = f"""
+try:
+    import orjson  # 可选依赖：Rust 实现的 JSON 序列化，内嵌 base64 预览时明显更快
+except ImportError:
+    orjson = None
+
+# 预览文件写在 Streamlit 的 static/ 目录下，开启静态文件服务后浏览器可直接通过 URL 获取
+STATIC_DIR = "static"
+STATIC_URL = "/app/static"
+
+# 前台（首屏级别）和后台（其余级别）线程合并写 manifest.json 时使用
+MANIFEST_LOCK = threading.Lock()
+
+# 面板页面模板在导入时编译一次，渲染时只替换原图信息和预览数据；页面中的 JS 模板字符串用 $$ 转义
+SMART_PANEL_HTML_TEMPLATE = string.Template("""
         <!DOCTYPE html>
         <html>
         <head>
+            ${PRELOAD_LINK}
             <style>
-                .smart-container {{
+                .smart-container {
                     position: relative;
                     width: 100%;
                     height: 70vh;
@@ -188,9 +46,9 @@ class SmartPreviewPanel:
                     border-radius: 16px;
                     overflow: hidden;
                     box-shadow: 0 10px 30px rgba(0,0,0,0.3);
-                }}
+                }
                 
-                .preview-display {{
+                .preview-display {
                     position: relative;
                     width: 100%;
                     height: 100%;
@@ -198,22 +56,22 @@ class SmartPreviewPanel:
                     align-items: center;
                     justify-content: center;
                     overflow: hidden;
-                }}
+                }
                 
-                .preview-image {{
+                .preview-image {
                     max-width: 100%;
                     max-height: 100%;
                     border-radius: 8px;
                     box-shadow: 0 5px 20px rgba(0,0,0,0.4);
                     transition: all 0.4s cubic-bezier(0.4, 0, 0.2, 1);
                     transform: scale(0.95);
-                }}
+                }
                 
-                .preview-image.loaded {{
+                .preview-image.loaded {
                     transform: scale(1);
-                }}
+                }
                 
-                .floating-panel {{
+                .floating-panel {
                     position: absolute;
                     top: 20px;
                     right: 20px;
@@ -227,30 +85,30 @@ class SmartPreviewPanel:
                     overflow-y: auto;
                     z-index: 1000;
                     transition: transform 0.3s ease, opacity 0.3s ease;
-                }}
+                }
                 
-                .floating-panel.collapsed {{
+                .floating-panel.collapsed {
                     transform: translateX(calc(100% - 50px));
                     opacity: 0.8;
-                }}
+                }
                 
-                .panel-header {{
+                .panel-header {
                     display: flex;
                     justify-content: between;
                     align-items: center;
                     margin-bottom: 20px;
                     padding-bottom: 15px;
                     border-bottom: 2px solid #e0e0e0;
-                }}
+                }
                 
-                .panel-title {{
+                .panel-title {
                     font-size: 18px;
                     font-weight: 600;
                     color: #333;
                     margin: 0;
-                }}
+                }
                 
-                .collapse-btn {{
+                .collapse-btn {
                     width: 32px;
                     height: 32px;
                     border: none;
@@ -263,17 +121,17 @@ class SmartPreviewPanel:
                     align-items: center;
                     justify-content: center;
                     transition: background 0.2s ease;
-                }}
+                }
                 
-                .collapse-btn:hover {{
+                .collapse-btn:hover {
                     background: #45a049;
-                }}
+                }
                 
-                .quality-selector {{
+                .quality-selector {
                     margin-bottom: 20px;
-                }}
+                }
                 
-                .quality-option {{
+                .quality-option {
                     display: flex;
                     align-items: center;
                     padding: 12px;
@@ -282,52 +140,52 @@ class SmartPreviewPanel:
                     cursor: pointer;
                     transition: all 0.2s ease;
                     border: 2px solid transparent;
-                }}
+                }
                 
-                .quality-option:hover {{
+                .quality-option:hover {
                     background: #f5f5f5;
                     transform: translateY(-1px);
-                }}
+                }
                 
-                .quality-option.active {{
+                .quality-option.active {
                     background: linear-gradient(135deg, #4CAF50, #45a049);
                     color: white;
                     border-color: #4CAF50;
                     transform: scale(1.02);
-                }}
+                }
                 
-                .quality-info {{
+                .quality-info {
                     flex-grow: 1;
-                }}
+                }
                 
-                .quality-name {{
+                .quality-name {
                     font-weight: 600;
                     font-size: 14px;
                     margin-bottom: 4px;
-                }}
+                }
                 
-                .quality-details {{
+                .quality-details {
                     font-size: 11px;
                     opacity: 0.8;
-                }}
+                }
                 
-                .quality-badge {{
+                .quality-badge {
                     background: rgba(255,255,255,0.2);
                     color: currentColor;
                     padding: 4px 8px;
                     border-radius: 20px;
                     font-size: 10px;
                     font-weight: 500;
-                }}
+                }
                 
-                .action-buttons {{
+                .action-buttons {
                     display: grid;
                     grid-template-columns: 1fr 1fr;
                     gap: 10px;
                     margin-top: 20px;
-                }}
+                }
                 
-                .action-btn {{
+                .action-btn {
                     padding: 12px;
                     border: none;
                     border-radius: 12px;
@@ -339,68 +197,68 @@ class SmartPreviewPanel:
                     align-items: center;
                     justify-content: center;
                     gap: 8px;
-                }}
+                }
                 
-                .download-btn {{
+                .download-btn {
                     background: linear-gradient(135deg, #FF6B6B, #EE5A52);
                     color: white;
                     grid-column: span 2;
-                }}
+                }
                 
-                .download-btn:hover {{
+                .download-btn:hover {
                     transform: translateY(-2px);
                     box-shadow: 0 8px 25px rgba(255,107,107,0.4);
-                }}
+                }
                 
-                .share-btn {{
+                .share-btn {
                     background: linear-gradient(135deg, #4ECDC4, #44A08D);
                     color: white;
-                }}
+                }
                 
-                .info-btn {{
+                .info-btn {
                     background: linear-gradient(135deg, #45B7D1, #3498DB);
                     color: white;
-                }}
+                }
                 
-                .stats-section {{
+                .stats-section {
                     margin-top: 20px;
                     padding: 15px;
                     background: linear-gradient(135deg, #667eea, #764ba2);
                     border-radius: 12px;
                     color: white;
-                }}
+                }
                 
-                .stats-title {{
+                .stats-title {
                     font-size: 14px;
                     font-weight: 600;
                     margin-bottom: 12px;
-                }}
+                }
                 
-                .stats-grid {{
+                .stats-grid {
                     display: grid;
                     grid-template-columns: 1fr 1fr;
                     gap: 10px;
-                }}
+                }
                 
-                .stat-item {{
+                .stat-item {
                     text-align: center;
                     padding: 8px;
                     background: rgba(255,255,255,0.1);
                     border-radius: 8px;
-                }}
+                }
                 
-                .stat-value {{
+                .stat-value {
                     font-size: 16px;
                     font-weight: 700;
                     display: block;
-                }}
+                }
                 
-                .stat-label {{
+                .stat-label {
                     font-size: 10px;
                     opacity: 0.8;
-                }}
+                }
                 
-                .loading-indicator {{
+                .loading-indicator {
                     position: absolute;
                     top: 50%;
                     left: 50%;
@@ -414,48 +272,48 @@ class SmartPreviewPanel:
                     font-size: 14px;
                     font-weight: 500;
                     z-index: 2000;
-                }}
+                }
                 
-                .loading-spinner {{
+                .loading-spinner {
                     width: 20px;
                     height: 20px;
                     border: 2px solid #ddd;
                     border-top: 2px solid #4CAF50;
                     border-radius: 50%;
                     animation: spin 1s linear infinite;
-                }}
+                }
                 
-                @keyframes spin {{
-                    0% {{ transform: rotate(0deg); }}
-                    100% {{ transform: rotate(360deg); }}
-                }}
+                @keyframes spin {
+                    0% { transform: rotate(0deg); }
+                    100% { transform: rotate(360deg); }
+                }
                 
-                .smart-recommendations {{
+                .smart-recommendations {
                     margin-top: 15px;
                     padding: 12px;
                     background: #FFF3E0;
                     border-left: 4px solid #FF9800;
                     border-radius: 8px;
-                }}
+                }
                 
-                .recommendation-title {{
+                .recommendation-title {
                     font-size: 12px;
                     font-weight: 600;
                     color: #E65100;
                     margin-bottom: 8px;
-                }}
+                }
                 
-                .recommendation-text {{
+                .recommendation-text {
                     font-size: 11px;
                     color: #BF360C;
                     line-height: 1.4;
-                }}
+                }
             </style>
         </head>
         <body>
             <div class="smart-container">
                 <div class="preview-display">
-                    <img class="preview-image" id="mainPreview" alt="智能预览">
+                    <img class="preview-image" id="mainPreview" alt="智能预览" decoding="async">
                 </div>
                 
                 <div class="floating-panel" id="actionPanel">
@@ -484,19 +342,19 @@ class SmartPreviewPanel:
                         <div class="stats-title">📊 图像统计</div>
                         <div class="stats-grid">
                             <div class="stat-item">
-                                <span class="stat-value">{self.original_width:,}</span>
+                                <span class="stat-value">${ORIGINAL_WIDTH}</span>
                                 <span class="stat-label">宽度(px)</span>
                             </div>
                             <div class="stat-item">
-                                <span class="stat-value">{self.original_height:,}</span>
+                                <span class="stat-value">${ORIGINAL_HEIGHT}</span>
                                 <span class="stat-label">高度(px)</span>
                             </div>
                             <div class="stat-item">
-                                <span class="stat-value">{original_size:.1f}</span>
+                                <span class="stat-value">${ORIGINAL_SIZE_1F}</span>
                                 <span class="stat-label">大小(MB)</span>
                             </div>
                             <div class="stat-item">
-                                <span class="stat-value">{output_format}</span>
+                                <span class="stat-value">${OUTPUT_FORMAT}</span>
                                 <span class="stat-label">格式</span>
                             </div>
                         </div>
@@ -517,12 +375,12 @@ class SmartPreviewPanel:
             </div>
             
             <script>
-                class SmartPreviewSystem {{
-                    constructor(previews) {{
+                class SmartPreviewSystem {
+                    constructor(previews) {
                         this.previews = previews;
                         this.currentQuality = 'instant';
                         this.panelCollapsed = false;
-                        this.loadingTimes = {{}};
+                        this.loadingTimes = {};
                         this.userPreferences = this.loadUserPreferences();
                         
                         this.mainPreview = document.getElementById('mainPreview');
@@ -532,19 +390,19 @@ class SmartPreviewPanel:
                         this.recommendationText = document.getElementById('recommendationText');
                         
                         this.init();
-                    }}
+                    }
                     
-                    async init() {{
+                    async init() {
                         this.buildQualitySelector();
                         await this.smartLoadSequence();
                         this.generateRecommendations();
                         this.trackUserBehavior();
-                    }}
+                    }
                     
-                    buildQualitySelector() {{
+                    buildQualitySelector() {
                         const qualityOrder = ['instant', 'quick', 'detailed', 'full'];
                         
-                        qualityOrder.forEach(quality => {{
+                        qualityOrder.forEach(quality => {
                             if (!this.previews[quality]) return;
                             
                             const preview = this.previews[quality];
@@ -554,19 +412,19 @@ class SmartPreviewPanel:
                             
                             option.innerHTML = `
                                 <div class="quality-info">
-                                    <div class="quality-name">${{preview.description}}</div>
+                                    <div class="quality-name">$${preview.description}</div>
                                     <div class="quality-details">
-                                        ${{preview.width}}×${{preview.height}} | ${{preview.file_size_kb.toFixed(1)}}KB
+                                        $${preview.width}×$${preview.height} | $${preview.file_size_kb.toFixed(1)}KB
                                     </div>
                                 </div>
-                                <div class="quality-badge">${{preview.quality}}%</div>
+                                <div class="quality-badge">$${preview.quality}%</div>
                             `;
                             
                             this.qualitySelector.appendChild(option);
-                        }});
-                    }}
+                        });
+                    }
                     
-                    async smartLoadSequence() {{
+                    async smartLoadSequence() {
                         // 智能加载序列：根据网络状况和用户偏好调整
                         const startTime = performance.now();
                         
@@ -575,27 +433,27 @@ class SmartPreviewPanel:
                         
                         // 预测用户需求，预加载下一级别
                         const predictedNext = this.predictNextQuality();
-                        if (predictedNext !== 'instant') {{
-                            setTimeout(() => {{
+                        if (predictedNext !== 'instant') {
+                            setTimeout(() => {
                                 this.preloadPreview(predictedNext);
-                            }}, 500);
-                        }}
+                            }, 500);
+                        }
                         
                         const loadTime = performance.now() - startTime;
                         this.loadingTimes['sequence'] = loadTime;
                         
                         this.hideLoadingIndicator();
-                    }}
+                    }
                     
-                    async loadPreview(quality) {{
+                    async loadPreview(quality) {
                         const preview = this.previews[quality];
                         if (!preview) return;
                         
                         const startTime = performance.now();
                         
-                        return new Promise((resolve) => {{
+                        return new Promise((resolve) => {
                             const img = new Image();
-                            img.onload = () => {{
+                            img.onload = () => {
                                 this.mainPreview.src = img.src;
                                 this.mainPreview.classList.add('loaded');
                                 
@@ -604,186 +462,528 @@ class SmartPreviewPanel:
                                 
                                 this.updateQualitySelector(quality);
                                 resolve();
-                            }};
-                            img.src = 'data:image/webp;base64,' + preview.base64;
-                        }});
-                    }}
+                            };
+                            img.src = preview.url;
+                        });
+                    }
                     
-                    preloadPreview(quality) {{
+                    preloadPreview(quality) {
                         const preview = this.previews[quality];
                         if (!preview) return;
                         
                         const img = new Image();
-                        img.src = 'data:image/webp;base64,' + preview.base64;
-                    }}
+                        img.src = preview.url;
+                    }
                     
-                    selectQuality(quality) {{
+                    selectQuality(quality) {
                         if (this.currentQuality === quality) return;
                         
                         this.currentQuality = quality;
                         this.loadPreview(quality);
                         this.saveUserPreference(quality);
-                    }}
+                    }
                     
-                    updateQualitySelector(activeQuality) {{
+                    updateQualitySelector(activeQuality) {
                         const options = this.qualitySelector.querySelectorAll('.quality-option');
-                        options.forEach((option, index) => {{
+                        options.forEach((option, index) => {
                             option.classList.remove('active');
-                        }});
+                        });
                         
                         const qualityOrder = ['instant', 'quick', 'detailed', 'full'];
                         const activeIndex = qualityOrder.indexOf(activeQuality);
-                        if (activeIndex !== -1 && options[activeIndex]) {{
+                        if (activeIndex !== -1 && options[activeIndex]) {
                             options[activeIndex].classList.add('active');
-                        }}
-                    }}
+                        }
+                    }
                     
-                    predictNextQuality() {{
+                    predictNextQuality() {
                         // 基于用户历史偏好和当前网络状况预测
                         const preferences = this.userPreferences;
                         const networkSpeed = this.estimateNetworkSpeed();
                         
-                        if (preferences.favorite_quality) {{
+                        if (preferences.favorite_quality) {
                             return preferences.favorite_quality;
-                        }}
+                        }
                         
                         if (networkSpeed === 'fast') return 'detailed';
                         if (networkSpeed === 'medium') return 'quick';
                         return 'instant';
-                    }}
+                    }
                     
-                    estimateNetworkSpeed() {{
+                    estimateNetworkSpeed() {
                         const instantLoadTime = this.loadingTimes['instant'] || 1000;
                         if (instantLoadTime < 200) return 'fast';
                         if (instantLoadTime < 500) return 'medium';
                         return 'slow';
-                    }}
+                    }
                     
-                    generateRecommendations() {{
+                    generateRecommendations() {
                         const networkSpeed = this.estimateNetworkSpeed();
-                        const imageSize = {original_size};
+                        const imageSize = ${ORIGINAL_SIZE};
                         
                         let recommendation = '';
                         
-                        if (imageSize > 10) {{
+                        if (imageSize > 10) {
                             recommendation = '⚠️ 大图像文件，建议使用"详细预览"平衡质量与加载速度。';
-                        }} else if (networkSpeed === 'fast') {{
+                        } else if (networkSpeed === 'fast') {
                             recommendation = '⚡ 网络状况良好，可以使用"完整预览"获得最佳体验。';
-                        }} else if (networkSpeed === 'slow') {{
+                        } else if (networkSpeed === 'slow') {
                             recommendation = '🐌 网络较慢，推荐使用"快速预览"以获得更流畅的体验。';
-                        }} else {{
+                        } else {
                             recommendation = '✨ 推荐使用"详细预览"，在质量和速度之间取得最佳平衡。';
-                        }}
+                        }
                         
                         this.recommendationText.textContent = recommendation;
-                    }}
+                    }
                     
-                    hideLoadingIndicator() {{
-                        setTimeout(() => {{
+                    hideLoadingIndicator() {
+                        setTimeout(() => {
                             this.loadingIndicator.style.opacity = '0';
-                            setTimeout(() => {{
+                            setTimeout(() => {
                                 this.loadingIndicator.style.display = 'none';
-                            }}, 300);
-                        }}, 1000);
-                    }}
+                            }, 300);
+                        }, 1000);
+                    }
                     
-                    loadUserPreferences() {{
-                        try {{
+                    loadUserPreferences() {
+                        try {
                             const saved = localStorage.getItem('smart_preview_preferences');
-                            return saved ? JSON.parse(saved) : {{}};
-                        }} catch {{
-                            return {{}};
-                        }}
-                    }}
+                            return saved ? JSON.parse(saved) : {};
+                        } catch {
+                            return {};
+                        }
+                    }
                     
-                    saveUserPreference(quality) {{
-                        try {{
+                    saveUserPreference(quality) {
+                        try {
                             const preferences = this.loadUserPreferences();
                             preferences.favorite_quality = quality;
                             preferences.last_used = new Date().toISOString();
                             localStorage.setItem('smart_preview_preferences', JSON.stringify(preferences));
-                        }} catch {{
+                        } catch {
                             // 忽略存储错误
-                        }}
-                    }}
+                        }
+                    }
                     
-                    trackUserBehavior() {{
+                    trackUserBehavior() {
                         // 简单的用户行为跟踪
                         let scrollCount = 0;
                         let qualityChanges = 0;
                         
-                        window.addEventListener('scroll', () => {{
+                        window.addEventListener('scroll', () => {
                             scrollCount++;
-                        }});
+                        });
                         
                         // 记录质量变更次数
                         const originalSelectQuality = this.selectQuality;
-                        this.selectQuality = (quality) => {{
+                        this.selectQuality = (quality) => {
                             qualityChanges++;
                             originalSelectQuality.call(this, quality);
-                        }};
-                    }}
-                }}
+                        };
+                    }
+                }
                 
                 // 全局函数
                 let smartPreview;
                 
-                function togglePanel() {{
+                function togglePanel() {
                     const panel = document.getElementById('actionPanel');
                     const btn = document.getElementById('collapseBtn');
                     
-                    if (smartPreview.panelCollapsed) {{
+                    if (smartPreview.panelCollapsed) {
                         panel.classList.remove('collapsed');
                         btn.textContent = '←';
                         smartPreview.panelCollapsed = false;
-                    }} else {{
+                    } else {
                         panel.classList.add('collapsed');
                         btn.textContent = '→';
                         smartPreview.panelCollapsed = true;
-                    }}
-                }}
+                    }
+                }
                 
-                function downloadOriginal() {{
+                function downloadOriginal() {
                     // 触发Streamlit的下载按钮
                     const event = new CustomEvent('streamlit:downloadOriginal');
                     window.parent.document.dispatchEvent(event);
-                }}
+                }
                 
-                function shareImage() {{
-                    if (navigator.share) {{
-                        navigator.share({{
+                function shareImage() {
+                    if (navigator.share) {
+                        navigator.share({
                             title: '长图分享',
                             text: '查看这个精美的长图！',
                             url: window.location.href
-                        }});
-                    }} else {{
+                        });
+                    } else {
                         // 复制链接到剪贴板
-                        navigator.clipboard.writeText(window.location.href).then(() => {{
+                        navigator.clipboard.writeText(window.location.href).then(() => {
                             alert('链接已复制到剪贴板！');
-                        }});
-                    }}
-                }}
+                        });
+                    }
+                }
                 
-                function showImageInfo() {{
+                function showImageInfo() {
                     const info = `
                         图像信息:
-                        尺寸: {self.original_width:,} × {self.original_height:,} 像素
-                        文件大小: {original_size:.2f} MB
-                        格式: {output_format}
-                        纵横比: {self.aspect_ratio:.2f}
+                        尺寸: ${ORIGINAL_WIDTH} × ${ORIGINAL_HEIGHT} 像素
+                        文件大小: ${ORIGINAL_SIZE_2F} MB
+                        格式: ${OUTPUT_FORMAT}
+                        纵横比: ${ASPECT_RATIO}
                     `;
                     alert(info);
-                }}
+                }
                 
                 // 初始化系统
-                const previewsData = {previews_json};
+                const previewsData = ${PREVIEWS_JSON};
                 smartPreview = new SmartPreviewSystem(previewsData);
             </script>
         </body>
         </html>
-        """
+        """)
+
+@functools.lru_cache(maxsize=16)
+def encode_preview_base64(preview_path: str, mtime: float) -> str:
+    """读取并 base64 编码预览文件，按（路径, 修改时间）缓存，重跑时不再重复编码"""
+    with open(preview_path, 'rb') as f:
+        return binascii.b2a_base64(f.read(), newline=False).decode()
+
+# 水印背景的内边距和距图像边缘的留白
+WATERMARK_PADDING = 5
+WATERMARK_MARGIN = 10
+
+# 水印字体候选：先按名称查找 DejaVuSans（Linux 常见），再尝试 macOS 的 Arial 和 DejaVu 的标准安装路径
+WATERMARK_FONT_CANDIDATES = (
+    "DejaVuSans.ttf",
+    "/System/Library/Fonts/Arial.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+)
+
+@functools.lru_cache(maxsize=8)
+def get_watermark_font(font_size: int):
+    """按字号缓存水印字体，TTF 文件只打开解析一次；都找不到时使用默认字体"""
+    for font_path in WATERMARK_FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(font_path, font_size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+@functools.lru_cache(maxsize=16)
+def render_watermark_tile(watermark_text: str, font_size: int) -> Image.Image:
+    """把水印（半透明背景 + 文字）预先绘制成一张小的 RGBA 图块，同样的文字和字号只栅格化一次"""
+    font = get_watermark_font(font_size)
+    
+    # 获取文本尺寸
+    bbox = ImageDraw.Draw(Image.new('RGBA', (1, 1))).textbbox((0, 0), watermark_text, font=font)
+    text_width = bbox[2] - bbox[0]
+    text_height = bbox[3] - bbox[1]
+    
+    tile = Image.new(
+        'RGBA',
+        (text_width + 2 * WATERMARK_PADDING + 1, text_height + 2 * WATERMARK_PADDING + 1),
+        (0, 0, 0, 128)
+    )
+    ImageDraw.Draw(tile).text(
+        (WATERMARK_PADDING, WATERMARK_PADDING), watermark_text, font=font, fill=(255, 255, 255, 200)
+    )
+    return tile
+
+@functools.lru_cache(maxsize=16)
+def get_watermark_layers(watermark_text: str, font_size: int, mode: str) -> Tuple[Image.Image, Image.Image]:
+    """水印图块预先转换为目标图像模式，并拆出 alpha 蒙版，贴图时只在水印区域内混合，不再每次转换模式"""
+    tile = render_watermark_tile(watermark_text, font_size)
+    return tile.convert(mode), tile.getchannel('A')
+
+@functools.lru_cache(maxsize=None)
+def ensure_analytics_dir() -> str:
+    """用户行为分析目录是进程内固定路径，只在首次调用时创建"""
+    analytics_dir = os.path.join("analytics", "user_behavior")
+    os.makedirs(analytics_dir, exist_ok=True)
+    return analytics_dir
+
+class SmartPreviewPanel:
+    def __init__(self, image_path: str):
+        self.image_path = image_path
+        self.base_name = os.path.splitext(os.path.basename(image_path))[0]
+        # 缓存目录按内容哈希命名：改名重传的相同文件共享预览，同名但内容不同的文件不会读到旧预览
+        stat = os.stat(image_path)
+        self.mtime = stat.st_mtime
+        self.source_key = preview_cache_key(image_path, stat.st_mtime, stat.st_size)
+        self.preview_cache_dir = os.path.join(STATIC_DIR, "smart_cache", self.source_key)
+        self.analytics_dir = ensure_analytics_dir()
+        
+        # 获取图像基础信息（只读文件头，按修改时间缓存，重跑时不再打开文件）
+        self.original_width, self.original_height, self.file_size_mb = get_image_info(image_path, stat.st_mtime)
+        self.aspect_ratio = self.original_height / self.original_width
+        
+        # 智能预览配置
+        self.smart_preview_levels = {
+            'instant': {
+                'width': 400, 
+                'quality': 60, 
+                'method': 2,  # libwebp 编码力度：小尺寸档位压缩收益有限，优先编码速度
+                'description': '瞬时预览',
+                'load_time_target': 0.5  # 秒
+            },
+            'quick': {
+                'width': 800, 
+                'quality': 75, 
+                'method': 2,
+                'description': '快速预览',
+                'load_time_target': 1.0
+            },
+            'detailed': {
+                'width': 1200, 
+                'quality': 85, 
+                'method': 4,
+                'description': '详细预览',
+                'load_time_target': 2.0
+            },
+            'full': {
+                'width': 2000, 
+                'quality': 95, 
+                'method': 6,
+                'description': '完整预览',
+                'load_time_target': 5.0
+            }
+        }
+        
+        # 各级别目标尺寸用整数运算一次算好，高度不受浮点舍入影响，缓存文件名稳定
+        self.targets = {}
+        for level_name, config in self.smart_preview_levels.items():
+            target_width = min(config['width'], self.original_width)
+            self.targets[level_name] = (target_width, max(1, target_width * self.original_height // self.original_width))
+    
+    def load_manifest(self) -> Dict[str, Dict]:
+        """读取缓存目录中的 manifest.json，返回缓存文件仍然存在的预览级别"""
+        try:
+            with open(os.path.join(self.preview_cache_dir, "manifest.json"), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if manifest.get('source_key') != self.source_key:
+            return {}
+        return {level: info for level, info in manifest['previews'].items() if os.path.exists(info['path'])}
+    
+    def save_manifest(self, new_previews: Dict[str, Dict]):
+        """把新生成的级别合并进 manifest.json；前台和后台线程都会写，加锁后先读再原子替换"""
+        manifest_path = os.path.join(self.preview_cache_dir, "manifest.json")
+        with MANIFEST_LOCK:
+            previews = self.load_manifest()
+            previews.update(new_previews)
+            with open(manifest_path + ".part", 'w', encoding='utf-8') as f:
+                json.dump({'source_key': self.source_key, 'previews': previews}, f, ensure_ascii=False)
+            os.replace(manifest_path + ".part", manifest_path)
+    
+    def generate_initial(self) -> Dict[str, Dict]:
+        """只同步生成最小的级别用于首屏，返回当前已有的全部级别（其余级别可能尚未生成）"""
+        smallest = min(self.smart_preview_levels, key=lambda name: self.smart_preview_levels[name]['width'])
+        try:
+            return self.generate_smart_previews([smallest])
+        except Exception as e:
+            st.error(f"生成智能预览失败: {str(e)}")
+            return {}
+    
+    def generate_remaining(self, executor: ThreadPoolExecutor):
+        """在后台线程池中生成其余级别，返回 Future；异常保存在 Future 中，由脚本线程负责提示"""
+        return executor.submit(self.generate_smart_previews)
+    
+    def generate_smart_previews(self, level_names: Optional[List[str]] = None) -> Dict[str, Dict]:
+        """生成智能预览版本，level_names 为空时生成全部级别；manifest.json 中已有的级别直接复用，不打开原图。
+        按配置顺序返回当前已有的全部级别"""
+        previews = self.load_manifest()
+        missing = [name for name in (level_names or self.smart_preview_levels) if name not in previews]
+        
+        if missing:
+            # 缓存目录只在需要生成时创建
+            os.makedirs(self.preview_cache_dir, exist_ok=True)
+            # 一次 scandir 取得已缓存文件的大小，不再逐级 stat
+            with os.scandir(self.preview_cache_dir) as it:
+                cached_sizes = {entry.name: entry.stat().st_size for entry in it if entry.is_file()}
+            new_previews = {}
+            levels = sorted(
+                ((name, self.smart_preview_levels[name]) for name in missing),
+                key=lambda item: item[1]['width'], reverse=True
+            )
+            with Image.open(self.image_path) as original_img:
+                # 原图只解码一次；按宽度从大到小逐级缩小，每一级以上一级（未加水印）的结果为输入，
+                # 下一级缩小完成后再把上一级交给线程加水印和WebP编码（Pillow/libwebp 会释放 GIL），
+                # 水印直接画在该级图像上，无需复制。
+                # 安装了 pyvips 时最大的一级由 libvips 流式解码并缩小，原图不会整幅载入内存
+                if pyvips is None:
+                    # JPEG 源图在解码时按 1/2、1/4、1/8 做 DCT 域缩小，只需不小于本次最大的预览尺寸
+                    if original_img.format == 'JPEG':
+                        original_img.draft('RGB', self.targets[levels[0][0]])
+                    original_img.load()
+                parent_img = original_img
+                with ThreadPoolExecutor(max_workers=len(levels)) as executor:
+                    futures = {}
+                    deferred = None  # 等待下一级从它缩小后再提交的（图像, 级别, 配置）
+                    for level_name, config in levels:
+                        target_size = self.targets[level_name]
+                        cached_size = cached_sizes.get(os.path.basename(self.get_preview_path(level_name, target_size)))
+                        if cached_size is not None:
+                            preview_info = self.create_smart_preview(None, level_name, config, cached_size)
+                            if preview_info:
+                                new_previews[level_name] = preview_info
+                            continue
+                        if parent_img.size == target_size:
+                            # 尺寸相同（原图不大于目标尺寸）：在主线程复制一份，各级不共用同一图像
+                            parent_img = parent_img.copy()
+                        elif parent_img is original_img and pyvips is not None:
+                            parent_img = vips_thumbnail(self.image_path, target_size)
+                        else:
+                            parent_img = parent_img.resize(target_size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+                        if deferred:
+                            futures[deferred[1]] = executor.submit(self.create_smart_preview, *deferred)
+                        deferred = (parent_img, level_name, config)
+                    if deferred:
+                        futures[deferred[1]] = executor.submit(self.create_smart_preview, *deferred)
+                    for level_name, future in futures.items():
+                        preview_info = future.result()
+                        if preview_info:
+                            new_previews[level_name] = preview_info
+            
+            self.save_manifest(new_previews)
+            previews.update(new_previews)
         
-        return html_code
+        # 按配置顺序返回
+        return {name: previews[name] for name in self.smart_preview_levels if name in previews}
+    
+    def get_preview_path(self, level_name: str, target_size: Tuple[int, int]) -> str:
+        """预览级别的缓存文件路径"""
+        return os.path.join(self.preview_cache_dir, f"smart_{level_name}_{target_size[0]}x{target_size[1]}.webp")
+    
+    def create_smart_preview(self, img: Optional[Image.Image], level_name: str, config: Dict,
+                             cached_size: Optional[int] = None) -> Optional[Dict]:
+        """创建单个智能预览版本；img 已是目标尺寸时水印直接画在 img 上，调用方之后不应再使用它。
+        cached_size 为已缓存文件的字节数，给出时直接复用缓存文件，img 可以为 None"""
+        try:
+            target_width, target_height = self.targets[level_name]
+            
+            preview_path = self.get_preview_path(level_name, (target_width, target_height))
+            
+            if cached_size is None:
+                # 创建预览图像（调用方已缩放到目标尺寸时直接使用）
+                if img.size != (target_width, target_height):
+                    preview_img = img.resize((target_width, target_height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+                else:
+                    preview_img = img
+                
+                # 添加智能水印（包含预览信息）
+                preview_img = self.add_smart_watermark(preview_img, level_name, config)
+                
+                # 在内存中编码一次WebP，大小直接取字节长度，再一次性写入缓存文件
+                buf = io.BytesIO()
+                preview_img.save(
+                    buf, 
+                    'WEBP', 
+                    quality=config['quality'],
+                    method=config['method']
+                )
+                data = buf.getbuffer()
+                file_size = len(data) / 1024  # KB
+                with open(preview_path, 'wb', buffering=0) as f:
+                    f.write(data)
+            else:
+                file_size = cached_size / 1024  # KB
+            
+            # base64 不写入 manifest，渲染面板时再按需编码
+            return {
+                'path': preview_path,
+                'width': target_width,
+                'height': target_height,
+                'file_size_kb': file_size,
+                'quality': config['quality'],
+                'description': config['description'],
+                'load_time_target': config['load_time_target']
+            }
+            
+        except Exception as e:
+            return None
+    
+    def add_smart_watermark(self, img: Image.Image, level_name: str, config: Dict) -> Image.Image:
+        """添加智能水印信息，直接画在传入的图像上（调用方须传入自己独占的图像）"""
+        try:
+            watermarked = img
+            
+            # 水印信息
+            watermark_text = f"{config['description']} | {config['quality']}% 质量"
+            
+            # 取缓存的水印图块
+            img_width, img_height = watermarked.size
+            font_size = max(12, min(24, img_width // 50))
+            tile, mask = get_watermark_layers(watermark_text, font_size, watermarked.mode)
+            
+            # 计算位置（右下角，留边距），以图块的 alpha 作为蒙版贴上
+            x = img_width - tile.width + WATERMARK_PADDING + 1 - WATERMARK_MARGIN
+            y = img_height - tile.height + WATERMARK_PADDING + 1 - WATERMARK_MARGIN
+            watermarked.paste(tile, (x, y), mask)
+            
+            return watermarked
+            
+        except Exception:
+            # 如果水印添加失败，返回原图
+            return img
+    
+    def get_smart_panel_html(self, previews: Dict[str, Dict], output_format: str) -> str:
+        """生成智能预览面板HTML"""
+        
+        # 开启静态文件服务时只传 URL，浏览器并行请求并缓存；否则退回内嵌 base64
+        static_serving = st.get_option("server.enableStaticServing")
+        previews_src = {}
+        for level, info in previews.items():
+            if static_serving:
+                url = f"{STATIC_URL}/" + os.path.relpath(info['path'], STATIC_DIR).replace(os.sep, '/')
+            else:
+                url = 'data:image/webp;base64,' + encode_preview_base64(info['path'], os.path.getmtime(info['path']))
+            previews_src[level] = dict(info, url=url)
+        if orjson is not None:
+            previews_json = orjson.dumps(previews_src).decode()
+        else:
+            previews_json = json.dumps(previews_src, separators=(',', ':'))
+        
+        # 首屏加载的瞬时预览交给浏览器的预加载扫描器，解析到 <head> 时即开始请求
+        preload_link = ''
+        if static_serving and 'instant' in previews_src:
+            preload_link = f'<link rel="preload" as="image" href="{previews_src["instant"]["url"]}">'
+        
+        # 原图文件大小（MB）
+        original_size = self.file_size_mb
+        
+        return SMART_PANEL_HTML_TEMPLATE.substitute(
+            ORIGINAL_WIDTH=f"{self.original_width:,}",
+            ORIGINAL_HEIGHT=f"{self.original_height:,}",
+            ORIGINAL_SIZE=original_size,
+            ORIGINAL_SIZE_1F=f"{original_size:.1f}",
+            ORIGINAL_SIZE_2F=f"{original_size:.2f}",
+            OUTPUT_FORMAT=output_format,
+            ASPECT_RATIO=f"{self.aspect_ratio:.2f}",
+            PREVIEWS_JSON=previews_json,
+            PRELOAD_LINK=preload_link
+        )
+
+@st.cache_resource
+def get_smart_preview_executor():
+    """后台生成其余预览级别的线程池"""
+    return ThreadPoolExecutor(max_workers=1)
+
+@st.cache_resource(show_spinner=False)
+def get_smart_preview_panel(image_path: str, mtime: float) -> SmartPreviewPanel:
+    """按（路径, 修改时间）缓存面板实例，重跑时不再读取文件头和计算内容哈希"""
+    return SmartPreviewPanel(image_path)
+
+@st.cache_resource(show_spinner=False)
+def start_remaining_previews(image_path: str, mtime: float):
+    """每个（路径, 修改时间）只提交一次后台生成任务"""
+    return get_smart_preview_panel(image_path, mtime).generate_remaining(get_smart_preview_executor())
+
+@st.fragment(run_every=1)
+def wait_for_remaining_previews(image_path: str, mtime: float):
+    """后台任务未完成时每秒检查一次，完成后整页重跑，让新级别出现在面板中（成功或失败都交给重跑处理）"""
+    if start_remaining_previews(image_path, mtime).done():
+        st.rerun()
+    st.info("其余预览级别正在后台生成，完成后自动刷新")
 
 def render_smart_preview_panel(image_path: str, output_format: str):
     """渲染智能预览面板界面"""
@@ -791,7 +991,7 @@ def render_smart_preview_panel(image_path: str, output_format: str):
     st.subheader("🧠 智能预览与快捷操作面板")
     
     # 初始化智能预览系统
-    smart_system = SmartPreviewPanel(image_path)
+    smart_system = get_smart_preview_panel(image_path, os.path.getmtime(image_path))
     
     # 显示系统信息
     col_info1, col_info2, col_info3 = st.columns(3)
@@ -800,18 +1000,25 @@ def render_smart_preview_panel(image_path: str, output_format: str):
         st.metric("原图尺寸", f"{smart_system.original_width}×{smart_system.original_height}")
     
     with col_info2:
-        file_size = os.path.getsize(image_path) / (1024 * 1024)
-        st.metric("文件大小", f"{file_size:.2f} MB")
+        st.metric("文件大小", f"{smart_system.file_size_mb:.2f} MB")
     
     with col_info3:
         st.metric("长宽比", f"{smart_system.aspect_ratio:.2f}")
     
-    # 生成智能预览
+    # 首屏只同步生成瞬时预览，其余级别在后台生成，完成后自动重跑出现在面板中
     with st.spinner("🔄 生成智能预览版本..."):
-        previews = smart_system.generate_smart_previews()
+        previews = smart_system.generate_initial()
+    future = start_remaining_previews(image_path, smart_system.mtime)
+    if future.done() and future.exception() is not None:
+        # 后台线程里调用 st.error 不会显示，失败只能在脚本线程中提示；清掉缓存的 Future，下次重跑时重新提交
+        st.error(f"后台生成其余预览级别失败: {future.exception()}")
+        start_remaining_previews.clear()
     
     if previews:
         st.success(f"✅ 已生成 {len(previews)} 个智能预览级别")
+        if not future.done() and len(previews) < len(smart_system.smart_preview_levels):
+            # 只在任务进行中轮询，完成后的整页重跑不再调用该片段，轮询随之停止
+            wait_for_remaining_previews(image_path, smart_system.mtime)
         
         # 显示预览级别信息
         with st.expander("📋 预览级别详情", expanded=False):
@@ -837,15 +1044,14 @@ def render_smart_preview_panel(image_path: str, output_format: str):
         
         with col1:
             st.subheader("📥 下载选项")
-            with open(image_path, "rb") as file:
-                st.download_button(
-                    label="下载原始图像",
-                    data=file.read(),
-                    file_name=os.path.basename(image_path),
-                    mime=f"image/{output_format.lower()}",
-                    use_container_width=True,
-                    type="primary"
-                )
+            st.download_button(
+                label="下载原始图像",
+                data=read_file_bytes(image_path, smart_system.mtime),
+                file_name=os.path.basename(image_path),
+                mime=f"image/{output_format.lower()}",
+                use_container_width=True,
+                type="primary"
+            )
         
         with col2:
             st.subheader("🎯 智能特性")
@@ -12,54 +12,93 @@ import streamlit as st
 import streamlit.components.v1 as components
 from typing import List, Tuple, Dict
 import math
+from concurrent.futures import ThreadPoolExecutor
+from solutions.multi_level_preview import pyvips, preview_cache_key, read_file_bytes
+
+try:
+    import orjson  # 可选依赖：Rust 实现的 JSON 序列化，分块较多或内嵌 base64 时明显更快
+except ImportError:
+    orjson = None
+
+# 分块写在 Streamlit 的 static/ 目录下，开启静态文件服务后浏览器按需通过 URL 获取
+STATIC_DIR = "static"
+STATIC_URL = "/app/static"
+
+# 概览图缩小倍数；WebP 单边最大 16383 像素，超长图按需加大倍数
+OVERVIEW_SCALE = 8
+WEBP_MAX_SIZE = 16383
+
+# 同一列上下相邻的若干个分块合并成一张图集，减少文件数和 libwebp 初始化次数
+TILES_PER_SHEET = 4
+
+def save_tile(img: Image.Image, box: Tuple[int, int, int, int], tile_path: str):
+    """裁剪并编码单个分块，在线程池中执行（Pillow 裁剪和 libwebp 编码会释放 GIL）。
+    颜色不超过 256 种的分块（纯色背景上的文字等）用无损编码，体积很小；其余分块用有损编码"""
+    tile_img = img.crop(box)
+    if tile_img.getcolors(maxcolors=256) is not None:
+        tile_img.save(tile_path, 'WEBP', lossless=True, method=6)
+    else:
+        tile_img.save(tile_path, 'WEBP', quality=75, method=4)
 
 class VirtualScrollViewer:
-    def __init__(self, image_path: str, tile_height: int = 1000):
+    def __init__(self, image_path: str, tile_height: int = 1000, tile_width: int = 1024, use_inline: bool = False):
         self.image_path = image_path
         self.tile_height = tile_height
-        self.tiles_dir = os.path.join("tiles", os.path.splitext(os.path.basename(image_path))[0])
+        self.tile_width = tile_width
+        # 为 True 时总是把图集内嵌为 base64；默认只在未开启静态文件服务时内嵌
+        self.use_inline = use_inline
+        # 分块目录按内容哈希和分块尺寸命名：改名重传的相同文件共享分块，同名但内容不同的文件不会读到旧分块
+        stat = os.stat(image_path)
+        self.mtime = stat.st_mtime
+        self.file_size_mb = stat.st_size / (1024 * 1024)
+        self.source_key = preview_cache_key(image_path, stat.st_mtime, stat.st_size)
+        self.tiles_dir = os.path.join(STATIC_DIR, "tiles", f"{self.source_key}_{tile_width}x{tile_height}")
+        self.manifest_path = os.path.join(self.tiles_dir, "manifest.json")
+        self.overview_path = os.path.join(self.tiles_dir, "overview.webp")
         os.makedirs(self.tiles_dir, exist_ok=True)
         
         # 获取图像基本信息
         with Image.open(image_path) as img:
             self.image_width, self.image_height = img.size
-            self.total_tiles = math.ceil(self.image_height / tile_height)
+            # 按行列二维切分：宽图也只解码视窗横向范围内的分块，单块尺寸不会超出移动端纹理上限
+            self.rows = math.ceil(self.image_height / tile_height)
+            self.cols = math.ceil(self.image_width / tile_width)
+            self.total_tiles = self.rows * self.cols
+            self.tiles_per_sheet = max(1, min(TILES_PER_SHEET, WEBP_MAX_SIZE // tile_height))
+        
+        # 整幅图的低分辨率概览，作为分块加载前的背景
+        scale = max(OVERVIEW_SCALE, math.ceil(max(self.image_width, self.image_height) / WEBP_MAX_SIZE))
+        self.overview_size = (max(1, self.image_width // scale), max(1, self.image_height // scale))
+    
+    def load_manifest(self) -> List[Dict]:
+        """读取分块目录中的 manifest.json；记录的分块文件都还在时直接返回分块信息，否则返回空列表"""
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            with os.scandir(self.tiles_dir) as it:
+                existing = {entry.name for entry in it}
+        except (OSError, ValueError):
+            return []
+        tiles_info = manifest.get('tiles', [])
+        if manifest.get('source_key') != self.source_key or len(tiles_info) != self.total_tiles:
+            return []
+        if "overview.webp" not in existing or not all(tile_info['filename'] in existing for tile_info in tiles_info):
+            return []
+        return tiles_info
     
     def generate_tiles(self) -> List[Dict]:
-        """生成图像分块并返回分块信息"""
-        tiles_info = []
-        
+        """生成图像分块并返回分块信息；manifest.json 命中时不打开原图"""
         try:
-            with Image.open(self.image_path) as img:
-                for i in range(self.total_tiles):
-                    tile_filename = f"tile_{i:04d}.webp"
-                    tile_path = os.path.join(self.tiles_dir, tile_filename)
-                    
-                    # 计算分块区域
-                    top = i * self.tile_height
-                    bottom = min(top + self.tile_height, self.image_height)
-                    
-                    tile_info = {
-                        'index': i,
-                        'filename': tile_filename,
-                        'path': tile_path,
-                        'top': top,
-                        'bottom': bottom,
-                        'height': bottom - top,
-                        'width': self.image_width
-                    }
-                    
-                    # 如果分块不存在，则创建
-                    if not os.path.exists(tile_path):
-                        tile_img = img.crop((0, top, self.image_width, bottom))
-                        tile_img.save(tile_path, 'WEBP', quality=90, method=6)
-                    
-                    # 转换为base64用于web显示
-                    with open(tile_path, 'rb') as f:
-                        tile_data = f.read()
-                        tile_info['base64'] = base64.b64encode(tile_data).decode()
-                    
-                    tiles_info.append(tile_info)
+            tiles_info = self.load_manifest()
+            if not tiles_info:
+                tiles_info = self.build_tiles()
+                with open(self.manifest_path, 'w', encoding='utf-8') as f:
+                    json.dump({'source_key': self.source_key, 'tiles': tiles_info}, f)
+            
+            # 同一图集的分块只记录图集序号，URL 在生成页面时按图集各写一次，内嵌 base64 时不会按分块重复
+            sheet_indices = {}
+            for tile_info in tiles_info:
+                tile_info['sheet'] = sheet_indices.setdefault(tile_info['path'], len(sheet_indices))
                     
             return tiles_info
             
@@ -67,10 +106,107 @@ class VirtualScrollViewer:
             st.error(f"生成图像分块失败: {str(e)}")
             return []
     
+    def get_asset_url(self, path: str) -> str:
+        """开启静态文件服务时只传 URL，浏览器滚动到附近时才请求，不读取文件；否则退回内嵌 base64"""
+        if not self.use_inline and st.get_option("server.enableStaticServing"):
+            return f"{STATIC_URL}/" + os.path.relpath(path, STATIC_DIR).replace(os.sep, '/')
+        with open(path, 'rb') as f:
+            return 'data:image/webp;base64,' + base64.b64encode(f.read()).decode()
+    
+    def build_tiles(self) -> List[Dict]:
+        """生成缺失的图集文件，返回全部分块信息（不含图集序号）；filename/path 指向分块所在的图集，sy 为分块在图集中的纵向偏移"""
+        tiles_info = []
+        sheets = {}  # 图集文件名 -> （裁剪区域, 路径），按从上到下的顺序排列
+        sheet_height = self.tiles_per_sheet * self.tile_height
+        for i in range(self.total_tiles):
+            row, col = divmod(i, self.cols)
+            group = row // self.tiles_per_sheet
+            sheet_filename = f"sheet_{group:04d}_{col:03d}.webp"
+            sheet_path = os.path.join(self.tiles_dir, sheet_filename)
+            
+            # 计算分块和所在图集的区域
+            top = row * self.tile_height
+            bottom = min(top + self.tile_height, self.image_height)
+            left = col * self.tile_width
+            right = min(left + self.tile_width, self.image_width)
+            sheet_top = group * sheet_height
+            sheet_bottom = min(sheet_top + sheet_height, self.image_height)
+            
+            tile_info = {
+                'index': i,
+                'row': row,
+                'col': col,
+                'filename': sheet_filename,
+                'path': sheet_path,
+                'sy': top - sheet_top,
+                'top': top,
+                'bottom': bottom,
+                'left': left,
+                'height': bottom - top,
+                'width': right - left
+            }
+            
+            sheets[sheet_filename] = ((left, sheet_top, right, sheet_bottom), sheet_path)
+            tiles_info.append(tile_info)
+        
+        # 如果图集不存在，则加入待生成列表
+        pending = [(box, sheet_path) for box, sheet_path in sheets.values() if not os.path.exists(sheet_path)]
+        
+        overview_missing = not os.path.exists(self.overview_path)
+        if pyvips is not None:
+            if pending:
+                # libvips 顺序流式解码：从上到下逐行读取条带再切成分块，峰值内存约为一行分块，原图不会整幅载入内存
+                source = pyvips.Image.new_from_file(self.image_path, access='sequential')
+                strip, strip_top = None, None
+                for (left, top, right, bottom), tile_path in pending:
+                    if top != strip_top:
+                        strip = source.crop(0, top, self.image_width, bottom - top).copy_memory()
+                        strip_top = top
+                    strip.crop(left, 0, right - left, bottom - top).webpsave(tile_path, Q=75, effort=4, smart_subsample=True)
+            if overview_missing:
+                pyvips.Image.thumbnail(
+                    self.image_path, self.overview_size[0], height=self.overview_size[1], size='force'
+                ).webpsave(self.overview_path, Q=60, smart_subsample=True)
+        elif pending or overview_missing:
+            with Image.open(self.image_path) as img:
+                # 原图在主线程解码一次，各分块的裁剪和编码在线程池中并行执行
+                img.load()
+                if pending:
+                    with ThreadPoolExecutor(max_workers=min(len(pending), os.cpu_count() or 1)) as executor:
+                        futures = [executor.submit(save_tile, img, box, tile_path) for box, tile_path in pending]
+                        for future in futures:
+                            future.result()
+                if overview_missing:
+                    overview = img.resize(self.overview_size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+                    overview.save(self.overview_path, 'WEBP', quality=60)
+        
+        # 一次 scandir 取得全部分块的文件大小
+        with os.scandir(self.tiles_dir) as it:
+            tile_sizes = {entry.name: entry.stat().st_size for entry in it if entry.is_file()}
+        # 图集大小按其中的分块数平摊
+        tiles_in_sheet = {}
+        for tile_info in tiles_info:
+            tiles_in_sheet[tile_info['filename']] = tiles_in_sheet.get(tile_info['filename'], 0) + 1
+        for tile_info in tiles_info:
+            tile_info['file_size_kb'] = tile_sizes.get(tile_info['filename'], 0) / tiles_in_sheet[tile_info['filename']] / 1024
+        
+        return tiles_info
+    
     def get_viewer_html(self, tiles_info: List[Dict]) -> str:
         """生成虚拟滚动查看器的HTML代码"""
         
-        tiles_json = json.dumps(tiles_info)
+        # 图集 URL 按序号排列，分块通过 sheet 字段引用
+        sheet_paths = {tile_info['sheet']: tile_info['path'] for tile_info in tiles_info}
+        sheets = [self.get_asset_url(sheet_paths[index]) for index in range(len(sheet_paths))]
+        
+        if orjson is not None:
+            tiles_json = orjson.dumps(tiles_info).decode()
+            sheets_json = orjson.dumps(sheets).decode()
+        else:
+            tiles_json = json.dumps(tiles_info, separators=(',', ':'))
+            sheets_json = json.dumps(sheets, separators=(',', ':'))
+        
+        overview_url = self.get_asset_url(self.overview_path)
         
         html_code = f"""
         <!DOCTYPE html>
@@ -92,6 +228,16 @@ class VirtualScrollViewer:
                     position: relative;
                     width: {self.image_width}px;
                     height: {self.image_height}px;
+                    /* 低分辨率概览图先铺满整幅内容，清晰的分块解码后覆盖其上；
+                       概览图到达前由同一元素上的一层渐变显示加载动画，不再每个占位块各自动画 */
+                    background:
+                        url('{overview_url}') no-repeat 0 0 / 100% 100%,
+                        linear-gradient(90deg, #f0f0f0 25%, #e0e0e0 50%, #f0f0f0 75%) 0 0 / 200% 100%;
+                    animation: loading 2s infinite;
+                }}
+                
+                .virtual-content.overview-ready {{
+                    animation: none;
                 }}
                 
                 .tile-canvas {{
@@ -105,9 +251,6 @@ class VirtualScrollViewer:
                 .loading-placeholder {{
                     position: absolute;
                     left: 0;
-                    background: linear-gradient(90deg, #f0f0f0 25%, #e0e0e0 50%, #f0f0f0 75%);
-                    background-size: 200% 100%;
-                    animation: loading 2s infinite;
                     display: flex;
                     align-items: center;
                     justify-content: center;
@@ -116,8 +259,8 @@ class VirtualScrollViewer:
                 }}
                 
                 @keyframes loading {{
-                    0% {{ background-position: 200% 0; }}
-                    100% {{ background-position: -200% 0; }}
+                    0% {{ background-position: 0 0, 200% 0; }}
+                    100% {{ background-position: 0 0, -200% 0; }}
                 }}
                 
                 .scroll-indicator {{
@@ -175,15 +318,26 @@ class VirtualScrollViewer:
             
             <script>
                 class VirtualScrollViewer {{
-                    constructor(tilesData) {{
+                    constructor(tilesData, sheetsData) {{
                         this.tiles = tilesData;
+                        this.sheets = sheetsData;
                         this.container = document.getElementById('scrollContainer');
                         this.content = document.getElementById('virtualContent');
                         this.indicator = document.getElementById('scrollIndicator');
                         
-                        this.viewportHeight = 600;
                         this.bufferSize = 2; // 预加载前后2个tile
                         this.loadedTiles = new Map();
+                        this.placeholders = [];
+                        this.canvasPool = []; // 滚出视窗的canvas留在DOM中隐藏，供后续tile复用
+                        this.pendingLoads = new Set();
+                        this.sheetCache = new Map(); // 图集序号 -> 解码后位图的 Promise，按最近使用顺序排列
+                        // 缓存上限按预加载范围覆盖的图集行数 × 列数计算：纵向为视窗加上下各 bufferSize 行，
+                        // 横向为视窗加左右各一列，两端可能各跨一张图集/一列
+                        const sheetHeight = {self.tiles_per_sheet * self.tile_height};
+                        const sheetRows = Math.ceil((this.container.clientHeight + 2 * this.bufferSize * {self.tile_height}) / sheetHeight) + 1;
+                        const sheetCols = Math.min({self.cols}, Math.ceil(this.container.clientWidth / {self.tile_width}) + 3);
+                        this.maxSheets = sheetRows * sheetCols;
+                        this.flushScheduled = false;
                         this.currentScale = 1.0;
                         this.minScale = 0.1;
                         this.maxScale = 2.0;
@@ -192,14 +346,35 @@ class VirtualScrollViewer:
                     }}
                     
                     init() {{
-                        this.container.addEventListener('scroll', () => this.handleScroll());
+                        // 为每个分块预先放置占位元素，由 IntersectionObserver 在其进入视窗附近时加载、离开时卸载，
+                        // 滚动时不再逐帧计算可见范围
+                        this.tiles.forEach((tile, index) => {{
+                            const placeholder = document.createElement('div');
+                            placeholder.className = 'loading-placeholder';
+                            placeholder.dataset.index = index;
+                            placeholder.style.top = tile.top + 'px';
+                            placeholder.style.left = tile.left + 'px';
+                            placeholder.style.width = tile.width + 'px';
+                            placeholder.style.height = tile.height + 'px';
+                            placeholder.textContent = `加载中... (${{index + 1}}/${{this.tiles.length}})`;
+                            this.content.appendChild(placeholder);
+                            this.placeholders.push(placeholder);
+                        }});
+                        
+                        // rootMargin 相当于纵向预加载前后 bufferSize 行、横向预加载左右各一列tile
+                        this.observer = new IntersectionObserver(
+                            (entries) => this.handleIntersection(entries),
+                            {{ root: this.container, rootMargin: `${{this.bufferSize * {self.tile_height}}}px {self.tile_width}px` }}
+                        );
+                        this.placeholders.forEach(placeholder => this.observer.observe(placeholder));
+                        
+                        // 概览图加载完成后停止加载动画
+                        const overview = new Image();
+                        overview.onload = () => this.content.classList.add('overview-ready');
+                        overview.src = '{overview_url}';
+                        
+                        this.container.addEventListener('scroll', () => this.updateScrollIndicator(), {{ passive: true }});
                         this.container.addEventListener('wheel', (e) => this.handleWheel(e));
-                        this.updateVisibleTiles();
-                    }}
-                    
-                    handleScroll() {{
-                        this.updateVisibleTiles();
-                        this.updateScrollIndicator();
                     }}
                     
                     handleWheel(event) {{
@@ -210,72 +385,121 @@ class VirtualScrollViewer:
                         }}
                     }}
                     
-                    updateVisibleTiles() {{
-                        const scrollTop = this.container.scrollTop;
-                        const scrollBottom = scrollTop + this.viewportHeight;
-                        
-                        // 计算可见的tile范围
-                        const startIndex = Math.max(0, 
-                            Math.floor(scrollTop / {self.tile_height}) - this.bufferSize);
-                        const endIndex = Math.min(this.tiles.length - 1,
-                            Math.ceil(scrollBottom / {self.tile_height}) + this.bufferSize);
-                        
-                        // 移除不在视窗范围的tiles
-                        for (let [index, element] of this.loadedTiles) {{
-                            if (index < startIndex || index > endIndex) {{
-                                element.remove();
+                    handleIntersection(entries) {{
+                        for (const entry of entries) {{
+                            const index = Number(entry.target.dataset.index);
+                            if (entry.isIntersecting) {{
+                                if (!this.loadedTiles.has(index)) {{
+                                    this.pendingLoads.add(index);
+                                }}
+                            }} else if (this.pendingLoads.has(index)) {{
+                                this.pendingLoads.delete(index);
+                            }} else if (this.loadedTiles.has(index)) {{
+                                // 回收不在视窗范围的tile，释放位图但保留canvas节点
+                                this.releaseCanvas(this.loadedTiles.get(index));
                                 this.loadedTiles.delete(index);
+                                entry.target.style.visibility = 'visible';
                             }}
                         }}
-                        
-                        // 加载新的tiles
-                        for (let i = startIndex; i <= endIndex; i++) {{
-                            if (!this.loadedTiles.has(i)) {{
-                                this.loadTile(i);
+                        this.scheduleLoads();
+                    }}
+                    
+                    scheduleLoads() {{
+                        // 快速滑动时先显示概览图，等浏览器空闲后再加载仍在视窗附近的tile
+                        if (this.flushScheduled || this.pendingLoads.size === 0) return;
+                        this.flushScheduled = true;
+                        const flush = () => {{
+                            this.flushScheduled = false;
+                            for (const index of this.pendingLoads) {{
+                                this.loadTile(index);
                             }}
+                            this.pendingLoads.clear();
+                        }};
+                        if (window.requestIdleCallback) {{
+                            requestIdleCallback(flush, {{ timeout: 200 }});
+                        }} else {{
+                            setTimeout(flush, 50);
                         }}
                     }}
                     
-                    loadTile(index) {{
+                    async loadTile(index) {{
                         const tile = this.tiles[index];
                         if (!tile) return;
                         
-                        // 创建加载占位符
-                        const placeholder = document.createElement('div');
-                        placeholder.className = 'loading-placeholder';
-                        placeholder.style.top = tile.top + 'px';
-                        placeholder.style.width = tile.width + 'px';
-                        placeholder.style.height = tile.height + 'px';
-                        placeholder.textContent = `加载中... (${{index + 1}}/${{this.tiles.length}})`;
-                        
-                        this.content.appendChild(placeholder);
-                        this.loadedTiles.set(index, placeholder);
+                        const placeholder = this.placeholders[index];
                         
-                        // 创建图像元素
-                        const img = new Image();
-                        img.onload = () => {{
-                            placeholder.remove();
-                            
-                            const canvas = document.createElement('canvas');
-                            canvas.className = 'tile-canvas';
-                            canvas.style.top = tile.top + 'px';
-                            canvas.width = tile.width;
-                            canvas.height = tile.height;
-                            
-                            const ctx = canvas.getContext('2d');
-                            ctx.drawImage(img, 0, 0);
-                            
-                            this.content.appendChild(canvas);
-                            this.loadedTiles.set(index, canvas);
-                        }};
+                        const canvas = this.acquireCanvas();
+                        canvas.style.top = tile.top + 'px';
+                        canvas.style.left = tile.left + 'px';
+                        canvas.width = tile.width;
+                        canvas.height = tile.height;
+                        this.loadedTiles.set(index, canvas);
                         
-                        img.onerror = () => {{
+                        try {{
+                            const sheet = await this.getSheet(tile.sheet);
+                            // 从图集中截取本分块
+                            const bitmap = await createImageBitmap(sheet, 0, tile.sy, tile.width, tile.height);
+                            if (this.loadedTiles.get(index) !== canvas) {{
+                                // 解码期间已滚出视窗
+                                bitmap.close();
+                                return;
+                            }}
+                            // bitmaprenderer 直接接管位图，无需再复制一次像素
+                            canvas.getContext('bitmaprenderer').transferFromImageBitmap(bitmap);
+                            canvas.style.visibility = 'visible';
+                            placeholder.style.visibility = 'hidden';
+                        }} catch (error) {{
                             placeholder.textContent = `加载失败 (${{index + 1}}/${{this.tiles.length}})`;
                             placeholder.style.background = '#ffebee';
                             placeholder.style.color = '#c62828';
-                        }};
+                        }}
+                    }}
+                    
+                    getSheet(sheetIndex) {{
+                        let sheet = this.sheetCache.get(sheetIndex);
+                        if (sheet) {{
+                            this.sheetCache.delete(sheetIndex);
+                            this.sheetCache.set(sheetIndex, sheet);
+                            return sheet;
+                        }}
+                        
+                        // 分块 URL 按内容哈希命名、内容不会变化，直接使用浏览器缓存，回滚时不再重新验证；
+                        // createImageBitmap 在浏览器的解码线程中解码，不阻塞滚动
+                        sheet = fetch(this.sheets[sheetIndex], {{ cache: 'force-cache' }})
+                            .then(response => response.blob())
+                            .then(blob => createImageBitmap(blob));
+                        sheet.catch(() => this.sheetCache.delete(sheetIndex));
+                        this.sheetCache.set(sheetIndex, sheet);
+                        
+                        // 超出上限时从最久未用的图集开始淘汰，仍有分块显示在视窗附近的图集不淘汰
+                        if (this.sheetCache.size > this.maxSheets) {{
+                            const inUse = new Set();
+                            for (const index of this.loadedTiles.keys()) {{
+                                inUse.add(this.tiles[index].sheet);
+                            }}
+                            for (const cached of this.sheetCache.keys()) {{
+                                if (this.sheetCache.size <= this.maxSheets) break;
+                                if (!inUse.has(cached)) this.sheetCache.delete(cached);
+                            }}
+                        }}
+                        return sheet;
+                    }}
+                    
+                    acquireCanvas() {{
+                        const pooled = this.canvasPool.pop();
+                        if (pooled) return pooled;
                         
-                        img.src = 'data:image/webp;base64,' + tile.base64;
+                        const canvas = document.createElement('canvas');
+                        canvas.className = 'tile-canvas';
+                        canvas.style.visibility = 'hidden';
+                        this.content.appendChild(canvas);
+                        return canvas;
+                    }}
+                    
+                    releaseCanvas(canvas) {{
+                        canvas.style.visibility = 'hidden';
+                        canvas.getContext('bitmaprenderer').transferFromImageBitmap(null);
+                        this.canvasPool.push(canvas);
                     }}
                     
                     updateScrollIndicator() {{
@@ -318,7 +542,8 @@ class VirtualScrollViewer:
                 
                 // 初始化查看器
                 const tilesData = {tiles_json};
-                viewer = new VirtualScrollViewer(tilesData);
+                const sheetsData = {sheets_json};
+                viewer = new VirtualScrollViewer(tilesData, sheetsData);
             </script>
         </body>
         </html>
@@ -326,6 +551,16 @@ class VirtualScrollViewer:
         
         return html_code
 
+@st.cache_resource(show_spinner=False)
+def get_virtual_scroll_viewer(image_path: str, mtime: float, tile_height: int, tile_width: int) -> VirtualScrollViewer:
+    """按（路径, 修改时间, 分块尺寸）缓存查看器实例，重跑时不再读取文件头和计算内容哈希"""
+    return VirtualScrollViewer(image_path, tile_height=tile_height, tile_width=tile_width)
+
+@st.cache_data(show_spinner=False)
+def get_tiles_info(image_path: str, mtime: float, tile_height: int, tile_width: int) -> List[Dict]:
+    """按（路径, 修改时间, 分块尺寸）缓存分块信息"""
+    return get_virtual_scroll_viewer(image_path, mtime, tile_height, tile_width).generate_tiles()
+
 def render_virtual_scroll_viewer(image_path: str, output_format: str):
     """渲染虚拟滚动查看器界面"""
     
@@ -336,11 +571,16 @@ def render_virtual_scroll_viewer(image_path: str, output_format: str):
         st.subheader("虚拟滚动长图查看器")
         
         # 初始化查看器
-        viewer = VirtualScrollViewer(image_path, tile_height=1000)
+        mtime = os.path.getmtime(image_path)
+        viewer = get_virtual_scroll_viewer(image_path, mtime, 1000, 1024)
         
         # 显示加载进度
         with st.spinner("正在生成图像分块..."):
-            tiles_info = viewer.generate_tiles()
+            tiles_info = get_tiles_info(image_path, mtime, viewer.tile_height, viewer.tile_width)
+            if not tiles_info or not os.path.exists(tiles_info[0]['path']):
+                # 上次生成失败或分块目录被清理过，重新生成
+                get_tiles_info.clear()
+                tiles_info = get_tiles_info(image_path, mtime, viewer.tile_height, viewer.tile_width)
         
         if tiles_info:
             st.success(f"已生成 {len(tiles_info)} 个图像分块")
@@ -355,29 +595,25 @@ def render_virtual_scroll_viewer(image_path: str, output_format: str):
     with col2:
         st.subheader("下载与信息")
         
-        # 文件信息
-        file_size = os.path.getsize(image_path) / (1024 * 1024)
-        with Image.open(image_path) as img:
-            width, height = img.size
-        
+        # 文件信息（复用查看器已读取的尺寸和大小）
         st.info(f"""
         **图像信息**
-        - 尺寸: {width:,} × {height:,} px
-        - 大小: {file_size:.2f} MB
-        - 分块数量: {viewer.total_tiles}
-        - 每块高度: {viewer.tile_height}px
+        - 尺寸: {viewer.image_width:,} × {viewer.image_height:,} px
+        - 大小: {viewer.file_size_mb:.2f} MB
+        - 分块数量: {viewer.rows} 行 × {viewer.cols} 列
+        - 分块尺寸: {viewer.tile_width}×{viewer.tile_height}px
+        - 分块总大小: {sum(tile['file_size_kb'] for tile in tiles_info) / 1024:.2f} MB
         """)
         
-        # 下载按钮
-        with open(image_path, "rb") as file:
-            st.download_button(
-                label="📥 下载完整图像",
-                data=file.read(),
-                file_name=os.path.basename(image_path),
-                mime=f"image/{output_format.lower()}",
-                use_container_width=True,
-                type="primary"
-            )
+        # 下载按钮（文件内容按修改时间缓存，重跑时不再整份读入）
+        st.download_button(
+            label="📥 下载完整图像",
+            data=read_file_bytes(image_path, viewer.mtime),
+            file_name=os.path.basename(image_path),
+            mime=f"image/{output_format.lower()}",
+            use_container_width=True,
+            type="primary"
+        )
         
         # 查看器控制说明
         st.markdown("""